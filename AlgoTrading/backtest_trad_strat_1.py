@@ -0,0 +1,171 @@
+import pandas as pd
+import numpy as np
+from indicators import SMA, rolling_mean
+from ledger import Ledger
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Trader class implementing strategy similar to that found in 
+# algo_trad_strat_1
+# This class is meant to be used with the backtesting client
+# in BackTestingEnv
+# vectorized_backtest runs the same strategy over a whole price array at once
+
+class Trader:
+    def __init__(self, cash, tickers, short_memory, long_memory, recorder=None):
+        self.tickers = tickers
+        self.ledger = Ledger(cash) # cash, holdings and their marked value, updated in transactions
+        self.recorder = recorder # optional TradeRecorder (see trade_recorder), gets every fill and bar
+
+        self.moving_average = 0
+        self.short_mem_bid = SMA(short_memory)
+        self.long_mem_bid = SMA(long_memory)
+        self.short_mem_ask = SMA(short_memory)
+        self.long_mem_ask = SMA(long_memory)
+
+    # views of the ledger with the names used before it existed
+    @property
+    def cash(self):
+        return self.ledger.cash
+
+    @property
+    def holdings(self):
+        return self.ledger.positions_dict()
+
+    @property
+    def val_holdings(self):
+        return self.ledger.prices_dict()
+
+    @property
+    def holdings_to_cash(self):
+        return self.ledger.holdings_value
+
+    @property
+    def wealth(self):
+        return self.ledger.wealth
+
+    def transaction(self, cash_change, holding, position):
+        # update cash and holdings post transaction
+        # the ledger marks the position to market incrementally, no need to go through every holding
+        self.ledger.fill(self.ledger.symbol_id(holding), position, cash_change=cash_change)
+
+    def update_pnl(self):
+        # full revaluation of every holding, only needed to clear accumulated rounding
+        self.ledger.revalue()
+
+    def generate_signal(self, data):
+        # Receive data and make a trade decision
+        # This is where you'd implement a strategy
+
+        spread = 0.001
+        ticker = data['symbol'][0]
+        current_bid = data['close'][0]*(1-spread)
+        current_ask = data['close'][0]*(1+spread)
+
+        ma_sm_bid = self.short_mem_bid.update(current_bid)
+        ma_lm_bid = self.long_mem_bid.update(current_bid)
+        ma_sm_ask = self.short_mem_ask.update(current_ask)
+        ma_lm_ask = self.long_mem_ask.update(current_ask)
+
+        if (current_ask < self.cash) & (current_ask < ma_sm_bid < ma_lm_bid):
+            action = 2 #pos = buy, neg = sell
+        elif (current_ask < self.cash) & (current_ask < ma_sm_bid):
+            action = 1
+        elif (current_bid > ma_sm_ask) & (current_bid > ma_lm_ask):
+            action = -self.ledger.position(ticker)
+        else:
+            action = 0
+
+        cost = -action * current_ask if action >= 0 else -action * current_bid
+
+        sid = self.ledger.symbol_id(ticker)
+        self.ledger.update_price(sid, data['close'][0])
+        self.ledger.fill(sid, action, cash_change=cost)
+
+        if self.recorder is not None:
+            position = self.ledger.positions.item(sid)
+            if action != 0:
+                self.recorder.fill(ticker, action, current_ask if action >= 0 else current_bid, cost, position)
+            self.recorder.bar(self.ledger.cash, self.ledger.holdings_value, ticker, position)
+
+    def get_state(self):
+        # everything generate_signal depends on, as plain python values so checkpoints are
+        # small and taking one does not touch the objects' __dict__ (which makes their
+        # attribute lookups slower for the rest of the run, as pickling them would)
+        averages = [self.short_mem_bid, self.long_mem_bid, self.short_mem_ask, self.long_mem_ask]
+        return {'tickers': self.tickers, 'ledger': self.ledger.get_state(),
+                'averages': [average.get_state() for average in averages],
+                'recorder': self.recorder.get_state() if self.recorder is not None else None}
+
+    def set_state(self, state):
+        # restores a state from get_state into a trader built with the same memories
+        self.tickers = state['tickers']
+        self.ledger.set_state(state['ledger'])
+        averages = [self.short_mem_bid, self.long_mem_bid, self.short_mem_ask, self.long_mem_ask]
+        for average, average_state in zip(averages, state['averages']):
+            average.set_state(average_state)
+        if self.recorder is not None and state['recorder'] is not None:
+            self.recorder.set_state(state['recorder'])
+
+    def get_wealth(self):
+        # get method, technically unnecessary in python
+        return self.wealth
+
+
+def simulate_trades(bid, ask, close, ma_sm_bid, ma_lm_bid, ma_sm_ask, ma_lm_ask, cash, action, cash_path, holdings_path, wealth):
+    # path dependent part of Trader.generate_signal (cash constraint, selling the whole position)
+    # fills action, cash_path, holdings_path and wealth in place
+    holdings = 0
+    for t in range(len(close)):
+        current_bid = bid[t]
+        current_ask = ask[t]
+        if (current_ask < cash) and (current_ask < ma_sm_bid[t] < ma_lm_bid[t]):
+            a = 2
+        elif (current_ask < cash) and (current_ask < ma_sm_bid[t]):
+            a = 1
+        elif (current_bid > ma_sm_ask[t]) and (current_bid > ma_lm_ask[t]):
+            a = -holdings
+        else:
+            a = 0
+
+        cash += -a * current_ask if a >= 0 else -a * current_bid
+        holdings += a
+
+        action[t] = a
+        cash_path[t] = cash
+        holdings_path[t] = holdings
+        wealth[t] = cash + holdings*close[t] if holdings > 0 else cash
+
+if njit is not None:
+    simulate_trades_compiled = njit(cache=True)(simulate_trades)
+
+def vectorized_backtest(close, cash, short_memory, long_memory, spread=0.001):
+    # runs Trader's strategy over an array of close prices for a single ticker
+    # returns a dataframe with the bid/ask, action, cash, holdings and wealth after every bar
+    close = np.ascontiguousarray(close, dtype=float)
+    n = len(close)
+    bid = close*(1-spread)
+    ask = close*(1+spread)
+    ma_sm_bid = rolling_mean(bid, short_memory)
+    ma_lm_bid = rolling_mean(bid, long_memory)
+    ma_sm_ask = rolling_mean(ask, short_memory)
+    ma_lm_ask = rolling_mean(ask, long_memory)
+
+    if njit is not None:
+        action = np.empty(n, dtype=np.int64)
+        cash_path = np.empty(n)
+        holdings_path = np.empty(n, dtype=np.int64)
+        wealth = np.empty(n)
+        simulate_trades_compiled(bid, ask, close, ma_sm_bid, ma_lm_bid, ma_sm_ask, ma_lm_ask,
+                                 float(cash), action, cash_path, holdings_path, wealth)
+    else:
+        # plain python loop, lists keep the arithmetic on python floats
+        action, cash_path, holdings_path, wealth = [0]*n, [0.0]*n, [0]*n, [0.0]*n
+        simulate_trades(bid.tolist(), ask.tolist(), close.tolist(), ma_sm_bid.tolist(), ma_lm_bid.tolist(),
+                        ma_sm_ask.tolist(), ma_lm_ask.tolist(), float(cash), action, cash_path, holdings_path, wealth)
+
+    return pd.DataFrame({'bid': bid, 'ask': ask, 'action': action, 'cash': cash_path,
+                         'holdings': holdings_path, 'wealth': wealth})
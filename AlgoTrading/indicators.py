@@ -0,0 +1,251 @@
+import math
+import numpy as np
+from collections import deque
+from scipy.signal import lfilter
+
+# Streaming indicators shared by the live strategy (algo_trad_strat_1) and the
+# backtest Trader (backtest_trad_strat_1)
+# every update is constant time (amortized for min/max), update_batch takes an array
+# of new values, returns the indicator after each one and leaves the state as if
+# update had been called on every value
+
+def rolling_mean(x, window, block=65536):
+    # mean of the last window values, expanding at the start like sum(deque)/len(deque)
+    # cumulative sums restart every block so rounding error does not grow with the series
+    n = len(x)
+    out = np.empty(n)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        lo = max(0, start - window + 1)
+        cs = np.concatenate(([0.0], np.cumsum(x[lo:stop])))
+        t = np.arange(start, stop)
+        first = np.maximum(t - window + 1, 0)
+        out[start:stop] = (cs[t - lo + 1] - cs[first - lo])/(t - first + 1)
+    return out
+
+class SMA:
+    '''
+    Simple moving average of the last window values
+    Running sum is Kahan compensated so it does not drift on long streams
+    '''
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.compensation = 0.0
+        self.value = math.nan
+
+    def add(self, x):
+        # compensated self.total += x
+        y = x - self.compensation
+        t = self.total + y
+        self.compensation = (t - self.total) - y
+        self.total = t
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            self.add(-self.values[0])
+        self.values.append(x)
+        self.add(x)
+        self.value = self.total/len(self.values)
+        return self.value
+
+    def get_state(self):
+        # plain python values for checkpoints
+        return {'values': [float(x) for x in self.values], 'total': float(self.total),
+                'compensation': float(self.compensation), 'value': float(self.value)}
+
+    def set_state(self, state):
+        self.values.clear()
+        self.values.extend(state['values'])
+        self.total = state['total']
+        self.compensation = state['compensation']
+        self.value = state['value']
+
+    def update_batch(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return np.empty(0)
+        prev = np.fromiter(self.values, float, len(self.values))
+        out = rolling_mean(np.concatenate((prev, xs)), self.window)[len(prev):]
+
+        self.values.extend(xs[-self.window:].tolist())
+        self.total = math.fsum(self.values)
+        self.compensation = 0.0
+        self.value = out[-1]
+        return out
+
+class EMA:
+    '''
+    Exponential moving average, seeded with the first value
+    Give either span (alpha = 2/(span+1)) or alpha
+    '''
+
+    def __init__(self, span=None, alpha=None):
+        self.alpha = alpha if alpha is not None else 2/(span + 1)
+        self.value = math.nan
+
+    def update(self, x):
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value += self.alpha*(x - self.value)
+        return self.value
+
+    def update_batch(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return np.empty(0)
+        if math.isnan(self.value):
+            self.value = xs[0]
+        # y[t] = alpha*x[t] + (1-alpha)*y[t-1] as a first order filter
+        out, _ = lfilter([self.alpha], [1, self.alpha - 1], xs, zi=[(1 - self.alpha)*self.value])
+        self.value = out[-1]
+        return out
+
+class RollingVariance:
+    '''
+    Variance and standard deviation of the last window values
+    Uses Welford's update with a sliding window, ddof as in numpy
+    '''
+
+    def __init__(self, window, ddof=1):
+        self.window = window
+        self.ddof = ddof
+        self.values = deque(maxlen=window)
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared deviations from the mean
+
+    @property
+    def variance(self):
+        n = len(self.values)
+        return max(self.m2, 0.0)/(n - self.ddof) if n > self.ddof else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def update(self, x):
+        n = len(self.values)
+        if n == self.window:
+            # replace the oldest value
+            old = self.values[0]
+            delta = x - old
+            mean = self.mean + delta/n
+            self.m2 += delta*(x - mean + old - self.mean)
+            self.mean = mean
+        else:
+            delta = x - self.mean
+            self.mean += delta/(n + 1)
+            self.m2 += delta*(x - self.mean)
+        self.values.append(x)
+        return self.variance
+
+    def update_batch(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return np.empty(0)
+        prev = np.fromiter(self.values, float, len(self.values))
+        data = np.concatenate((prev, xs))
+        # moments are taken around the first value to limit cancellation
+        shifted = data - data[0]
+        mean = rolling_mean(shifted, self.window)[len(prev):]
+        mean_sq = rolling_mean(shifted**2, self.window)[len(prev):]
+        t = np.arange(len(prev), len(data))
+        n = np.minimum(t + 1, self.window)
+        m2 = np.maximum(mean_sq - mean**2, 0)*n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out = np.where(n > self.ddof, m2/(n - self.ddof), np.nan)
+
+        last = data[-self.window:]
+        self.values.extend(last.tolist())
+        self.mean = float(np.mean(last))
+        self.m2 = float(np.sum((last - self.mean)**2))
+        return out
+
+class RollingExtreme:
+    '''
+    Rolling max (or min) of the last window values with a monotonic deque
+    The deque holds (index, value) pairs that can still become the extreme
+    '''
+
+    def __init__(self, window, mode='max'):
+        self.window = window
+        self.sign = 1 if mode == 'max' else -1 # min is tracked as the max of -x
+        self.candidates = deque()
+        self.count = 0
+        self.value = math.nan
+
+    def update(self, x):
+        v = self.sign*x
+        while self.candidates and self.candidates[-1][1] <= v:
+            self.candidates.pop()
+        self.candidates.append((self.count, v))
+        if self.candidates[0][0] <= self.count - self.window:
+            self.candidates.popleft()
+        self.count += 1
+        self.value = self.sign*self.candidates[0][1]
+        return self.value
+
+    def update_batch(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return np.empty(0)
+        w = self.window
+        n = len(xs)
+
+        # last w-1 values before the batch, values that are no longer candidates (and
+        # positions before the stream started) are -inf since they can not be the extreme
+        prev = np.full(w - 1, -np.inf)
+        for i, v in self.candidates:
+            if i >= self.count - (w - 1):
+                prev[i - self.count + w - 1] = v
+        dense = np.concatenate((prev, self.sign*xs))
+        dense = np.concatenate((dense, np.full((-len(dense)) % w, -np.inf)))
+
+        # van Herk / Gil-Werman: split into blocks of window values, a window is covered by
+        # the suffix max of one block and the prefix max of the next
+        blocks = dense.reshape(-1, w)
+        prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+        suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+        right = np.arange(w - 1, w - 1 + n)
+        out = np.maximum(suffix[right - w + 1], prefix[right])
+
+        # rebuild the deque: values larger than everything after them in the last window
+        self.count += n
+        tail = dense[w - 1 + n - w:w - 1 + n]
+        later = np.append(np.maximum.accumulate(tail[::-1])[::-1][1:], -np.inf)
+        keep = np.flatnonzero((tail > later) & (tail > -np.inf))
+        self.candidates = deque(zip((keep + self.count - w).tolist(), tail[keep].tolist()))
+        self.value = self.sign*out[-1]
+        return self.sign*out
+
+class Crossover:
+    '''
+    Tracks the sign of fast - slow
+    update returns 1 when fast crosses above slow, -1 when it crosses below, 0 otherwise
+    '''
+
+    def __init__(self):
+        self.state = 0
+
+    def update(self, fast, slow):
+        state = int(fast > slow) - int(fast < slow)
+        cross = 0
+        if state != 0 and state != self.state:
+            cross = state if self.state != 0 else 0
+            self.state = state
+        return cross
+
+    def update_batch(self, fast, slow):
+        state = np.sign(np.asarray(fast, dtype=float) - np.asarray(slow, dtype=float)).astype(np.int64)
+        # carry the last non zero state forward, ties do not change it
+        idx = np.where(state != 0, np.arange(len(state)), -1)
+        idx = np.maximum.accumulate(idx)
+        held = np.where(idx >= 0, state[np.maximum(idx, 0)], self.state)
+        before = np.concatenate(([self.state], held[:-1]))
+        out = np.where((state != 0) & (state != before) & (before != 0), state, 0)
+        if len(held):
+            self.state = int(held[-1])
+        return out
@@ -0,0 +1,120 @@
+import numpy as np
+
+class Ledger:
+    '''
+    Cash and positions of a portfolio of many symbols, stored in numpy arrays
+        indexed by symbol id
+    The value of the holdings is kept up to date incrementally on every price
+        update and fill, so wealth, positions and cash cost O(1) per event no
+        matter how many symbols have been traded
+    Like Trader.update_pnl, only long positions count towards the holdings value
+    '''
+
+    def __init__(self, cash, capacity=64):
+        self.cash = cash
+        self.ids = {} # symbol -> id
+        self.symbols = [] # id -> symbol
+        self.positions = np.zeros(capacity)
+        self.prices = np.zeros(capacity) # last price seen for each symbol
+        self.holdings_value = 0.0
+
+    @property
+    def wealth(self):
+        return self.cash + self.holdings_value
+
+    def symbol_id(self, symbol):
+        # interns a symbol, arrays double in size when full
+        sid = self.ids.get(symbol)
+        if sid is None:
+            sid = len(self.symbols)
+            if sid == len(self.positions):
+                self.positions = np.concatenate((self.positions, np.zeros(sid)))
+                self.prices = np.concatenate((self.prices, np.zeros(sid)))
+            self.ids[symbol] = sid
+            self.symbols.append(symbol)
+        return sid
+
+    def position(self, symbol):
+        sid = self.ids.get(symbol)
+        return 0.0 if sid is None else self.positions.item(sid)
+
+    def update_price(self, sid, price):
+        # mark to market, only the symbol's own contribution changes
+        position = self.positions.item(sid)
+        if position > 0:
+            self.holdings_value += position*price - position*self.prices.item(sid)
+        self.prices[sid] = price
+
+    def fill(self, sid, quantity, price=None, cash_change=None):
+        # quantity > 0 buys, < 0 sells, cash moves by -quantity*price unless cash_change is given,
+        # without a price the fill is at the last price of the symbol
+        if price is not None:
+            self.update_price(sid, price)
+        position = self.positions.item(sid)
+        new_position = position + quantity
+        self.positions[sid] = new_position
+        self.cash += cash_change if cash_change is not None else -quantity*self.prices.item(sid)
+
+        mark = self.prices.item(sid)
+        old = position*mark if position > 0 else 0.0
+        new = new_position*mark if new_position > 0 else 0.0
+        self.holdings_value += new - old
+
+    def contribution(self, sids):
+        positions = self.positions[sids]
+        return np.where(positions > 0, positions*self.prices[sids], 0.0).sum()
+
+    def update_prices(self, sids, prices):
+        # batched mark to market, a symbol appearing twice keeps its last price
+        sids = np.asarray(sids, dtype=np.int64)
+        unique = np.unique(sids)
+        old = self.contribution(unique)
+        self.prices[sids] = prices
+        self.holdings_value += self.contribution(unique) - old
+
+    def fill_batch(self, sids, quantities, prices=None, cash_changes=None):
+        # batched fills, repeated symbols accumulate, without prices the fills are at the last prices
+        sids = np.asarray(sids, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=float)
+        unique = np.unique(sids)
+        old = self.contribution(unique)
+        if prices is not None:
+            self.prices[sids] = prices
+        np.add.at(self.positions, sids, quantities)
+        if cash_changes is not None:
+            self.cash += float(np.sum(cash_changes))
+        else:
+            self.cash -= float(np.dot(quantities, self.prices[sids] if prices is None else prices))
+        self.holdings_value += self.contribution(unique) - old
+
+    def revalue(self):
+        # full recomputation of the holdings value, removes any accumulated rounding
+        n = len(self.symbols)
+        self.holdings_value = float(self.contribution(np.arange(n)))
+        return self.wealth
+
+    def get_state(self):
+        # plain python values for checkpoints, see Trader.get_state
+        n = len(self.symbols)
+        return {'cash': float(self.cash), 'symbols': list(self.symbols), 'positions': self.positions[:n].tolist(),
+                'prices': self.prices[:n].tolist(), 'holdings_value': float(self.holdings_value)}
+
+    def set_state(self, state):
+        self.cash = state['cash']
+        self.ids = {}
+        self.symbols = []
+        for symbol in state['symbols']:
+            self.symbol_id(symbol)
+        n = len(self.symbols)
+        # slots past the state's symbols are cleared, a symbol interned later starts flat
+        self.positions[:n] = state['positions']
+        self.positions[n:] = 0
+        self.prices[:n] = state['prices']
+        self.prices[n:] = 0
+        self.holdings_value = state['holdings_value']
+
+    def positions_dict(self):
+        return {symbol: float(self.positions[sid]) for sid, symbol in enumerate(self.symbols)}
+
+    def prices_dict(self):
+        return {symbol: float(self.prices[sid]) for sid, symbol in enumerate(self.symbols)}
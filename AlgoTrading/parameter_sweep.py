@@ -0,0 +1,64 @@
+import os
+import itertools
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from backtest_trad_strat_1 import vectorized_backtest
+
+# Parameter sweep for the Trader strategy (backtest_trad_strat_1)
+# prices are written once to a memory mapped .npy file that every worker maps read only,
+# (ticker, short_memory, long_memory) combinations are spread over a process pool and
+# each one is run with vectorized_backtest
+
+prices = {} # ticker -> close prices, set in each worker by attach_prices
+
+def attach_prices(path, offsets):
+    # worker initializer, maps the shared file instead of receiving pickled arrays
+    global prices
+    data = np.load(path, mmap_mode='r')
+    prices = {ticker: data[start:stop] for ticker, (start, stop) in offsets.items()}
+
+def max_drawdown(wealth):
+    # largest fall from a running peak, as a decimal
+    peak = np.maximum.accumulate(wealth)
+    return float(np.max(1 - wealth/peak)) if len(wealth) else 0.0
+
+def evaluate(params):
+    ticker, short_memory, long_memory, cash = params
+    result = vectorized_backtest(prices[ticker], cash, short_memory, long_memory)
+    wealth = result['wealth'].to_numpy()
+    return {'ticker': ticker, 'short_memory': short_memory, 'long_memory': long_memory,
+            'final_wealth': wealth[-1] if len(wealth) else cash, 'max_drawdown': max_drawdown(wealth),
+            'trades': int(np.count_nonzero(result['action'].to_numpy()))}
+
+def parameter_sweep(price_data, short_memories, long_memories, cash=10000, workers=None, chunksize=1):
+    '''
+    price_data - dictionary of close price arrays keyed by ticker
+    short_memories, long_memories - window sizes to try
+    cash - starting cash of every run
+    workers - number of processes, defaults to the number of cores
+    returns a dataframe with one row per (ticker, short_memory, long_memory)
+    '''
+    offsets = {}
+    start = 0
+    for ticker, close in price_data.items():
+        offsets[ticker] = (start, start + len(close))
+        start += len(close)
+
+    fd, path = tempfile.mkstemp(suffix='.npy')
+    os.close(fd)
+    try:
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(start,))
+        for ticker, close in price_data.items():
+            data[offsets[ticker][0]:offsets[ticker][1]] = close
+        data.flush()
+        del data
+
+        grid = [(ticker, s, l, cash) for ticker, s, l in itertools.product(price_data, short_memories, long_memories)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_prices, initargs=(path, offsets)) as pool:
+            results = list(pool.map(evaluate, grid, chunksize=chunksize))
+    finally:
+        os.remove(path)
+
+    return pd.DataFrame(results, columns=['ticker', 'short_memory', 'long_memory', 'final_wealth', 'max_drawdown', 'trades'])
@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from collections import deque
+from indicators import SMA, EMA, RollingVariance, RollingExtreme
+from ledger import Ledger
+import backtest_trad_strat_1
+from backtest_trad_strat_1 import Trader, vectorized_backtest
+from parameter_sweep import parameter_sweep
+from trade_recorder import TradeRecorder
+
+# Benchmarks and parity checks for the backtest strategies
+# run as: python strategy_benchmarks.py <name>, with no name every benchmark runs
+# a parity check that fails raises AssertionError, so a run that finishes has passed them all
+
+def check(ok, message):
+    # parity checks stop the run instead of only being printed (unlike assert, not skipped under -O)
+    if not ok:
+        raise AssertionError(message)
+
+class Bar:
+    # one bar indexed like the one row dataframe the client sends (data['close'][0])
+    def __init__(self, symbol, close):
+        self.values = {'symbol': (symbol,), 'close': (close,)}
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+def random_walk(n_bars, seed=0):
+    rng = np.random.default_rng(seed)
+    return 150*np.exp(np.cumsum(rng.normal(0, 5e-4, n_bars)))
+
+def trader_path(close, cash, short_memory, long_memory):
+    # wealth and holdings after every bar, one generate_signal call per bar
+    trader = Trader(cash, 'AAPL', short_memory, long_memory)
+    wealth = np.empty(len(close))
+    holdings = np.empty(len(close), dtype=np.int64)
+    for t, price in enumerate(close.tolist()):
+        trader.generate_signal(Bar('AAPL', price))
+        wealth[t] = trader.get_wealth()
+        holdings[t] = trader.holdings['AAPL']
+    return wealth, holdings
+
+def bench_vectorized(n_parity=200000, n_bars=10000000, tolerance=1e-9):
+    # parity against the Trader class, for the numba and the plain python simulate_trades,
+    # then timing on a long series
+    compiler = backtest_trad_strat_1.njit
+    paths = [('numba', compiler)] if compiler is not None else []
+    for cash, short_memory, long_memory in [(10000, 5, 90), (1000, 10, 100), (50, 2, 30), (10000, 20, 60)]:
+        close = random_walk(n_parity, seed=short_memory)
+        t1 = time.time()
+        wealth, holdings = trader_path(close, cash, short_memory, long_memory)
+        t2 = time.time()
+        for path, njit in paths + [('python', None)]:
+            backtest_trad_strat_1.njit = njit
+            try:
+                result = vectorized_backtest(close, cash, short_memory, long_memory)
+            finally:
+                backtest_trad_strat_1.njit = compiler
+            same_holdings = np.array_equal(holdings, result['holdings'].to_numpy())
+            diff = np.abs(wealth - result['wealth'].to_numpy()).max()
+            print('vectorized parity %-6s (%d, %d, %d): holdings equal %s, max wealth diff %.2e, Trader %.0f bars/sec'
+                  % (path, cash, short_memory, long_memory, same_holdings, diff, n_parity/(t2-t1)))
+            check(same_holdings, 'vectorized %s holdings differ from Trader for (%d, %d, %d)' % (path, cash, short_memory, long_memory))
+            check(diff <= tolerance*cash, 'vectorized %s wealth differs from Trader by %.2e for (%d, %d, %d)'
+                  % (path, diff, cash, short_memory, long_memory))
+
+    close = random_walk(n_bars)
+    vectorized_backtest(close[:1000], 10000, 5, 90) # compile
+    t1 = time.time()
+    result = vectorized_backtest(close, 10000, 5, 90)
+    t2 = time.time()
+    print('vectorized: %d bars in %.3fs, %.0f bars/sec, final wealth %.2f' % (n_bars, t2-t1, n_bars/(t2-t1), result['wealth'].iloc[-1]))
+
+def bench_sweep(n_bars=1000000, tickers=4, workers=(1, 2, 4)):
+    # same grid with a growing number of processes
+    price_data = {'T%d' % i: random_walk(n_bars, seed=i) for i in range(tickers)}
+    short_memories = [2, 5, 10, 20]
+    long_memories = [30, 60, 90, 120]
+    base = None
+    for n in workers:
+        t1 = time.time()
+        table = parameter_sweep(price_data, short_memories, long_memories, workers=n)
+        t2 = time.time()
+        base = base or t2-t1
+        print('sweep: %d runs of %d bars with %d workers in %.3fs, speedup %.2fx' % (len(table), n_bars, n, t2-t1, base/(t2-t1)))
+    print(table.sort_values('final_wealth', ascending=False).head())
+
+def bench_indicators(windows=(10, 100, 1000, 10000), n_updates=100000, n_batch=10000000):
+    # streaming updates against re-summing a deque, then batched updates
+    prices = random_walk(n_updates).tolist()
+    for window in windows:
+        values = deque(maxlen=window)
+        t1 = time.time()
+        for x in prices:
+            values.append(x)
+            sum(values)/len(values)
+            max(values)
+        t2 = time.time()
+        sma = SMA(window)
+        rolling_max = RollingExtreme(window)
+        for x in prices:
+            sma.update(x)
+            rolling_max.update(x)
+        t3 = time.time()
+        print('indicators: window %5d, deque sum+max %.2f us/update, SMA+RollingExtreme %.2f us/update'
+              % (window, (t2-t1)/n_updates*1e6, (t3-t2)/n_updates*1e6))
+
+    prices = random_walk(n_batch)
+    for window in windows:
+        line = 'indicators: window %5d batch' % window
+        for name, indicator in [('SMA', SMA(window)), ('EMA', EMA(window)), ('var', RollingVariance(window)), ('max', RollingExtreme(window))]:
+            t1 = time.time()
+            indicator.update_batch(prices)
+            t2 = time.time()
+            line += ', %s %.1fM/sec' % (name, n_batch/(t2-t1)/1e6)
+        print(line)
+
+def bench_ledger(universes=(1, 100, 1000, 10000), n_events=100000):
+    # per event cost of marking and filling as the number of traded symbols grows
+    rng = np.random.default_rng(0)
+    for n_symbols in universes:
+        symbols = ['S%d' % i for i in range(n_symbols)]
+        picks = rng.integers(0, n_symbols, n_events).tolist()
+        prices = (100 + rng.normal(0, 1, n_events)).tolist()
+
+        # dictionaries re-summed on every fill like the old Trader.update_pnl
+        holdings = {s: 1 for s in symbols}
+        val_holdings = {s: 100.0 for s in symbols}
+        cash = 1e6
+        t1 = time.time()
+        for i, p in zip(picks[:n_events//10], prices):
+            val_holdings[symbols[i]] = p
+            holdings[symbols[i]] += 1
+            cash -= p
+            wealth = cash + sum(h*val_holdings[k] for k, h in holdings.items() if h > 0)
+        t2 = time.time()
+        dict_cost = (t2-t1)/(n_events//10)
+
+        ledger = Ledger(1e6)
+        ids = [ledger.symbol_id(s) for s in symbols]
+        for sid in ids:
+            ledger.fill(sid, 1, 100.0)
+        t1 = time.time()
+        for i, p in zip(picks, prices):
+            ledger.update_price(ids[i], p)
+            ledger.fill(ids[i], 1, cash_change=-p)
+            wealth = ledger.wealth
+        t2 = time.time()
+        drift = abs(ledger.wealth - ledger.revalue())
+        print('ledger: %5d symbols, dict re-sum %.2f us/event, Ledger %.2f us/event, drift %.1e'
+              % (n_symbols, dict_cost*1e6, (t2-t1)/n_events*1e6, drift))
+        check(drift <= 1e-10*abs(ledger.wealth), 'ledger wealth drifted %.2e from a revalue' % drift)
+
+    ledger = Ledger(1e6)
+    ids = np.array([ledger.symbol_id('S%d' % i) for i in range(10000)])
+    t1 = time.time()
+    for _ in range(100):
+        ledger.fill_batch(ids, np.ones(len(ids)), prices=100 + rng.normal(0, 1, len(ids)))
+        ledger.update_prices(ids, 100 + rng.normal(0, 1, len(ids)))
+    t2 = time.time()
+    print('ledger: batched fills and marks, %.0f events/sec' % (200*len(ids)/(t2-t1)))
+
+def bench_recorder(n_bars=1000000, flush_rows=65536):
+    # cost per bar of recording the equity curve and trade log, against appending rows to a list
+    close = random_walk(n_bars)
+    bars = [Bar('AAPL', price) for price in close.tolist()]
+    path = tempfile.mkdtemp()
+    try:
+        for name in ['none', 'list of rows', 'memory', 'parquet', 'npz']:
+            recorder = None
+            if name in ('parquet', 'npz'):
+                recorder = TradeRecorder(os.path.join(path, name), name, flush_rows)
+            elif name == 'memory':
+                recorder = TradeRecorder(flush_rows=flush_rows)
+            trader = Trader(10000, 'AAPL', 5, 90, recorder=recorder)
+            rows = []
+            t1 = time.time()
+            if name == 'list of rows':
+                for bar in bars:
+                    trader.generate_signal(bar)
+                    rows.append({'cash': trader.cash, 'holdings_value': trader.holdings_to_cash, 'wealth': trader.get_wealth()})
+            else:
+                for bar in bars:
+                    trader.generate_signal(bar)
+            if recorder is not None:
+                recorder.flush()
+            t2 = time.time()
+            line = 'recorder: %-12s %.2f us/bar' % (name, (t2-t1)/n_bars*1e6)
+            if recorder is not None:
+                equity = recorder.equity_curve()
+                fills = recorder.trade_log()
+                reference = vectorized_backtest(close, 10000, 5, 90)
+                diff = np.abs(equity['wealth'].to_numpy() - reference['wealth'].to_numpy()).max()
+                fills_match = np.array_equal(fills['bar'].to_numpy(), np.flatnonzero(reference['action'].to_numpy()))
+                line += ', %d bars, %d fills, max wealth diff %.1e, fills match %s' % (len(equity), len(fills), diff, fills_match)
+                check(len(equity) == n_bars and diff <= 1e-9*10000, 'recorder %s equity curve differs from the backtest' % name)
+                check(fills_match, 'recorder %s trade log differs from the backtest' % name)
+            print(line)
+    finally:
+        shutil.rmtree(path)
+
+benchmarks = {'vectorized': bench_vectorized, 'sweep': bench_sweep, 'indicators': bench_indicators, 'ledger': bench_ledger, 'recorder': bench_recorder}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        benchmarks[name]()
@@ -0,0 +1,239 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+# Trade log and equity curve of a backtest, recorded from inside the hot loop
+# rows are written into preallocated numpy columns and written out in batches
+# of flush_rows rows, so recording a bar costs a few hundred nanoseconds and memory
+# stays bounded however long the run is
+# output (when a path is given) is one file per table and flush in that directory,
+# equity_00000.parquet, equity_00001.parquet, ..., fills_00000.parquet, ... (or .npz),
+# so what has been flushed can be read at any time, even while the run goes on
+# without a path the tables grow in memory (doubling) and are never written
+# checkpoints (get_state) hold counters and part numbers only, the recorded rows are not copied
+#   into them: with a path the rows still buffered at a checkpoint are read back on resume from
+#   the part written after it, without a path a resumed run only has the rows from the checkpoint
+#   on (its tables start at the checkpoint's row numbers), so keeping whole tables across a resume
+#   needs a path
+
+class RecordTable:
+    '''
+    float64 columns of one table in a single (columns, capacity) block
+    Rows are written through a flat memoryview of the block, assigning into a
+        memoryview is several times cheaper than assigning numpy scalars
+    '''
+
+    def __init__(self, name, columns, capacity):
+        self.name = name
+        self.columns = columns
+        self.offset = 0 # rows already flushed
+        self.n = 0 # rows in the block
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        block = np.zeros((len(self.columns), capacity))
+        if self.n:
+            block[:, :self.n] = self.block[:, :self.n]
+        self.block = block
+        self.capacity = capacity
+        self.view = memoryview(block).cast('B').cast('d')
+
+    def get_state(self):
+        # rows already flushed and rows recorded in total
+        return {'offset': self.offset, 'rows': self.offset + self.n}
+
+    def set_state(self, state, rows=None):
+        # rows - the buffered rows of the state (columns, rows) when they could be recovered,
+        # otherwise the table starts after them
+        self.n = 0
+        if rows is None:
+            self.offset = state['rows']
+            return
+        self.offset = state['offset']
+        self.allocate(max(self.capacity, rows.shape[1]))
+        self.block[:, :rows.shape[1]] = rows
+        self.n = rows.shape[1]
+
+    def frame(self):
+        # rows in the block as a dataframe, row is the position of the row in the whole table
+        data = {'row': np.arange(self.offset, self.offset + self.n)}
+        for j, column in enumerate(self.columns):
+            data[column] = self.block[j, :self.n].copy()
+        return pd.DataFrame(data)
+
+class TradeRecorder:
+    '''
+    Equity curve (one row per bar) and trade log (one row per fill)
+    bar(cash, holdings_value, symbol, position) is called once per bar after any fill,
+        fill(symbol, quantity, price, cash_change, position) for every non zero trade
+    Fills record the bar they happened in, bars are numbered from 0 in call order
+    '''
+
+    equity_columns = ['cash', 'holdings_value', 'sid', 'position']
+    fill_columns = ['bar', 'sid', 'quantity', 'price', 'cash_change', 'position']
+
+    def __init__(self, path=None, format='parquet', flush_rows=65536):
+        '''
+        path - output directory, None keeps everything in memory
+        format - 'parquet' or 'npz'
+        flush_rows - rows buffered per table before they are written out
+        '''
+        self.path = path
+        self.format = format
+        self.flush_rows = flush_rows
+        self.equity = RecordTable('equity', self.equity_columns, flush_rows)
+        self.fills = RecordTable('fills', self.fill_columns, min(flush_rows, 4096))
+        self.ids = {} # symbol -> sid
+        self.symbols = []
+        self.parts = {} # table name -> files written
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def get_state(self):
+        # for checkpoints (see Trader.get_state): counters, part numbers and the symbol table,
+        # nothing is written out and no rows are copied
+        return {'symbols': list(self.symbols), 'parts': dict(self.parts),
+                'equity': self.equity.get_state(), 'fills': self.fills.get_state()}
+
+    def set_state(self, state):
+        # parts hold consecutive rows, so the first part written after the checkpoint starts with
+        # the rows that were buffered at the checkpoint, they are read back from it, then every
+        # part written after the checkpoint is removed and the resumed run writes them again
+        # rows that never reached a part (the run was killed first) are lost, bar numbers skip them
+        self.ids = {}
+        self.symbols = []
+        for symbol in state['symbols']:
+            self.symbol_id(symbol)
+        self.parts = dict(state['parts'])
+        for table in (self.equity, self.fills):
+            table_state = state[table.name]
+            buffered = table_state['rows'] - table_state['offset']
+            rows = None
+            if self.path is not None:
+                files = part_files(self.path, table.name)
+                fn = files.get(self.parts.get(table.name, 0))
+                if fn is not None:
+                    rows = self.untyped(table, read_part(fn).iloc[:buffered])
+                    if rows.shape[1] < buffered:
+                        rows = None
+                for part, fn in files.items():
+                    if part >= self.parts.get(table.name, 0):
+                        os.remove(fn)
+            table.set_state(table_state, rows)
+
+    def symbol_id(self, symbol):
+        sid = self.ids.get(symbol)
+        if sid is None:
+            sid = self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return sid
+
+    def bar(self, cash, holdings_value, symbol, position):
+        sid = self.ids.get(symbol)
+        if sid is None:
+            sid = self.symbol_id(symbol)
+        table = self.equity
+        i = table.n
+        if i == table.capacity:
+            self.spill(table)
+            i = table.n
+        view = table.view
+        capacity = table.capacity
+        view[i] = cash
+        view[capacity + i] = holdings_value
+        view[2*capacity + i] = sid
+        view[3*capacity + i] = position
+        table.n = i + 1
+
+    def fill(self, symbol, quantity, price, cash_change, position):
+        table = self.fills
+        i = table.n
+        if i == table.capacity:
+            self.spill(table)
+            i = table.n
+        view = table.view
+        capacity = table.capacity
+        view[i] = self.equity.offset + self.equity.n
+        view[capacity + i] = self.symbol_id(symbol)
+        view[2*capacity + i] = quantity
+        view[3*capacity + i] = price
+        view[4*capacity + i] = cash_change
+        view[5*capacity + i] = position
+        table.n = i + 1
+
+    def spill(self, table):
+        # a full block is written out when there is a path, otherwise it doubles
+        if self.path is None:
+            table.allocate(2*table.capacity)
+        else:
+            self.write(table)
+
+    def typed(self, table, df):
+        # columns with their real types and names, wealth is derived instead of recorded
+        if table.name == 'equity':
+            df = df.rename(columns={'row': 'bar'})
+            df['wealth'] = df['cash'] + df['holdings_value']
+        else:
+            df = df.drop(columns='row')
+            df['bar'] = df['bar'].astype(np.int64)
+        df['sid'] = df['sid'].astype(np.int64)
+        df.insert(df.columns.get_loc('sid'), 'symbol', np.array(self.symbols, dtype=object)[df['sid'].to_numpy()])
+        return df.drop(columns='sid')
+
+    def untyped(self, table, df):
+        # block columns (columns, rows) of a part read back, the inverse of typed
+        df = df.assign(sid=[self.ids[symbol] for symbol in df['symbol'].tolist()])
+        return np.array([df[column].to_numpy(dtype=float) for column in table.columns]).reshape(len(table.columns), len(df))
+
+    def write(self, table):
+        if table.n == 0:
+            return
+        df = self.typed(table, table.frame())
+        part = self.parts.get(table.name, 0)
+        fn = os.path.join(self.path, '%s_%05d.%s' % (table.name, part, self.format))
+        if self.format == 'parquet':
+            df.to_parquet(fn, index=False)
+        else:
+            np.savez(fn, **{column: df[column].to_numpy(dtype=str if column == 'symbol' else None) for column in df.columns})
+        self.parts[table.name] = part + 1
+        table.offset += table.n
+        table.n = 0
+
+    def flush(self):
+        # writes whatever is buffered, only meaningful with a path
+        if self.path is not None:
+            self.write(self.equity)
+            self.write(self.fills)
+
+    def table(self, name):
+        table = self.equity if name == 'equity' else self.fills
+        if self.path is None:
+            return self.typed(table, table.frame())
+        self.flush()
+        return load_table(self.path, name)
+
+    def equity_curve(self):
+        return self.table('equity')
+
+    def trade_log(self):
+        return self.table('fills')
+
+def part_files(path, name):
+    # part number -> file of the equity or fills table in path
+    files = {}
+    for fn in glob.glob(os.path.join(path, name + '_*.*')):
+        if fn.endswith('.parquet') or fn.endswith('.npz'):
+            files[int(os.path.basename(fn)[len(name) + 1:].split('.')[0])] = fn
+    return files
+
+def read_part(fn):
+    if fn.endswith('.parquet'):
+        return pd.read_parquet(fn)
+    with np.load(fn) as part:
+        return pd.DataFrame({column: part[column] for column in part.files})
+
+def load_table(path, name):
+    # reads back the equity or fills table a TradeRecorder wrote to path
+    frames = [read_part(fn) for _, fn in sorted(part_files(path, name).items())]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
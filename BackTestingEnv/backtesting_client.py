@@ -1,76 +1,207 @@
-import socket
-import pandas as pd
-import re
-from io import StringIO
-from algo_trading_strat_1 import Trader
-import time
-
-HOST, PORT = "localhost", 9999
-
-# types: singlerows - will receive single rows, dataframes - will receive whole dfs
-type = 'singlerows'
-
-# parameters sent to server upon connection
-data_structure = 'multi files linked' # 1 if reading single file, 0 if reading several files
-cycle = .001 # interval of time between server outputs in seconds
-directory = r"E:/Stocks/AAPL/".replace("\\","/") 
-regex = '^([A-z]{1,5})(_)([A-z]{0,10})(_)([0-9-; ]{0,25})(.[A-z]{0,10})'
-regex_last_bar = "^({[\s\S]*})*({[^{}]*})$"
-date_form = '%Y-%m-%d %H;%M;%S'
-
-# depending on the cycle length, the trader may miss some of the data sent by the server
-# this counts rows lost
-total_lost = 0
-
-t1 = time.time()
-
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-
-    # connect and send parameters to server
-    sock.connect((HOST, PORT))
-    config = str({'data_structure': data_structure, 'cycle': cycle, 'directory': directory, 'regex': regex, 'date_form': date_form})
-    sock.sendall(bytes(config, "utf-8"))
-    print("sent info")
-
-    # create trader
-    # see backtest_trad_strat_1 for this class in AlgoTrading
-    trader = Trader(10000, 'AAPL', 5, 90)
-
-    i = 0
-    while True:
-        if i % 10000 == 0:
-            print(trader.get_wealth())
-        i += 1
-        try:
-            if type == 'dataframes':
-                received = str(sock.recv(8192), "utf-8")
-                a = pd.read_json(StringIO(received))
-        
-            elif type == 'singlerows':
-                received = str(sock.recv(8192), "utf-8")
-                matches = re.findall(regex_last_bar, received)
-                last_bar = matches[0][-1]
-                lost = len(matches[0]) - 2 if len(matches[0][0]) == 0 else len(matches[0]) - 1
-                total_lost += lost
-                a = pd.read_json(StringIO(last_bar), typ='series')
-                a = a.to_frame()
-
-                # here data is given to the trader to make a decision
-                trader.generate_signal(a.T)
-
-        except Exception as e:
-            # these prints are for debugging
-            print(e)
-            print(received)
-            print(matches)
-            break
-
-# time it took to complete
-t2 = time.time()
-print(t2-t1)
-
-# Cash + value of holdings by the end of simulation
-print(trader.get_wealth())
-
-print(total_lost)
-    
+import os
+import socket
+import pandas as pd
+import re
+from io import StringIO
+from backtest_trad_strat_1 import Trader
+from trade_recorder import TradeRecorder
+from backtesting_protocol import FrameReader, send_frame, set_nodelay, BATCH, CONFIG, ACK, END, ERROR
+from pipeline_stats import PipelineStats, NullStats, dump_on_signal
+from checkpoint import Checkpointer, load_checkpoint, batch_position
+import time
+
+HOST, PORT = "localhost", 9999
+
+# types: singlerows - will receive single rows, dataframes - will receive whole dfs
+# binary - will receive length prefixed record batches (server wire_format must be 'binary')
+type = 'binary'
+
+# parameters sent to server upon connection
+data_structure = 'multi files linked' # 1 if reading single file, 0 if reading several files
+cycle = .001 # interval of time between server outputs in seconds
+merge_tickers = False # True - server sends every ticker's bars merged in timestamp order (binary only)
+replay_mode = 'lockstep' # 'lockstep' - server waits for an ack per batch (binary only), 'realtime' - server paces with cycle
+directory = r"E:/Stocks/AAPL/".replace("\\","/") 
+regex = '^([A-z]{1,5})(_)([A-z]{0,10})(_)([0-9-; ]{0,25})(.[A-z]{0,10})'
+regex_last_bar = "^({[\s\S]*})*({[^{}]*})$"
+date_form = '%Y-%m-%d %H;%M;%S'
+
+# timeframes - when set (binary only), the server aggregates rows into OHLCV/VWAP bars of every
+# timeframe (pandas frequencies such as ['5min', '1h']) and sends only completed bars, the trader
+# trades the bars of the first timeframe, the others are received (and counted) for other uses
+# checkpoints are not taken then, bars still open at a checkpoint would be lost on resume
+timeframes = []
+
+# stats_path - when set, time every stage of the run (see pipeline_stats): recv (waiting for and
+# reading a frame), decode, signal (Trader.generate_signal per bar) and ack, count bars and bytes,
+# print a summary and dump it as json to stats_path at the end of the run or on SIGUSR1
+stats_path = None
+
+# record_path - when set, the trader's equity curve (every bar) and trade log (every fill) are
+# written to this directory in batches (see trade_recorder), record_format is 'parquet' or 'npz'
+record_path = None
+record_format = 'parquet'
+
+# checkpoint_path - when set (binary only), the replay position and the trader are saved to this file
+# every checkpoint_rows bars and when the connection drops (see checkpoint)
+# if the file exists when the client starts, the run resumes from it instead of starting over
+checkpoint_path = None
+checkpoint_rows = 100000
+
+# depending on the cycle length, the trader may miss some of the data sent by the server
+# this counts rows lost
+total_lost = 0
+
+stats = PipelineStats('client') if stats_path else NullStats()
+if stats_path:
+    dump_on_signal(stats, stats_path)
+recv, decode, signal, ack = [stats.stage(stage) for stage in ('recv', 'decode', 'signal', 'ack')]
+
+t1 = time.time()
+
+with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+
+    # create trader
+    # see backtest_trad_strat_1 for this class in AlgoTrading
+    recorder = TradeRecorder(record_path, record_format) if record_path else None
+    trader = Trader(10000, 'AAPL', 5, 90, recorder=recorder)
+
+    # resume from the last checkpoint if there is one
+    i = 0
+    checkpoint = load_checkpoint(checkpoint_path) if type == 'binary' else None
+    if checkpoint is not None:
+        trader.set_state(checkpoint['state'])
+        i = checkpoint['rows']
+        print("resuming at", checkpoint['position'], "after", i, "rows")
+    checkpointer = Checkpointer(checkpoint_path, checkpoint_rows) if checkpoint_path and type == 'binary' and not timeframes else None
+
+    # connect and send parameters to server
+    sock.connect((HOST, PORT))
+    config = {'data_structure': data_structure, 'cycle': cycle, 'replay_mode': replay_mode, 'merge_tickers': merge_tickers,
+              'directory': directory, 'regex': regex, 'date_form': date_form}
+    if timeframes:
+        config['timeframes'] = timeframes
+    if checkpoint is not None:
+        config['start'] = checkpoint['position']
+    if type == 'binary':
+        set_nodelay(sock)
+        send_frame(sock, CONFIG, config)
+    else:
+        sock.sendall(bytes(str(config), "utf-8"))
+    print("sent info")
+
+    if type == 'binary':
+        # frames are never split or merged, so no rows are lost
+        reader = FrameReader(sock)
+        meta, first = None, 0 # batch being processed and the bars done before it, for checkpoints
+        trade_timeframe = timeframes[0] if timeframes else None
+        finished = False
+        error = None # reason sent by the server when it cannot replay
+        t = stats.start()
+        try:
+            while True:
+                kind, meta_next, body = reader.recv_frame()
+                t = recv.lap(t)
+                if kind == END:
+                    finished = True
+                    break
+                if kind == ERROR:
+                    error = meta_next.get('error')
+                    break
+                if kind != BATCH:
+                    continue
+                meta, first = meta_next, i
+                batch = reader.decode_batch(meta, body)
+                t = decode.lap(t)
+                if meta.get('timeframe') != trade_timeframe:
+                    stats.count('bars_' + meta.get('timeframe', 'rows'), len(batch))
+                    batch = batch[:0]
+                for j in range(len(batch)):
+                    if i % 10000 == 0:
+                        print(trader.get_wealth())
+                    # one row view of the batch, indexes like the one row dataframe below
+                    trader.generate_signal(batch[j:j+1])
+                    i += 1
+                    t = signal.lap(t)
+                    if checkpointer is not None and checkpointer.due(i):
+                        checkpointer.save(i, batch_position(meta, j), trader.get_state())
+                stats.count('bars', len(batch))
+                stats.count('batches')
+                if replay_mode == 'lockstep':
+                    # tell the server the batch is done so it sends the next one
+                    send_frame(sock, ACK, {'seq': meta['seq']})
+                    t = ack.lap(t)
+        except Exception as e:
+            # whatever failed, progress is kept up to the last bar the trader finished (a bar
+            # that raised in generate_signal is replayed on resume), then only a dropped
+            # connection lets the run end normally
+            if checkpointer is not None and meta is not None:
+                checkpointer.save(i, batch_position(meta, i - first - 1), trader.get_state())
+            if not isinstance(e, OSError):
+                raise
+            print(e)
+        finally:
+            if checkpointer is not None:
+                # waits for the last snapshot, the writer thread dies with the process
+                checkpointer.close()
+        stats.count('bytes', reader.bytes_received)
+        if checkpointer is not None and finished and os.path.exists(checkpoint_path):
+            # a finished run starts over next time
+            os.remove(checkpoint_path)
+        if error is not None:
+            raise RuntimeError('replay failed on the server: %s' % error)
+
+    else:
+        while True:
+            if i % 10000 == 0:
+                print(trader.get_wealth())
+            i += 1
+            try:
+                t = stats.start()
+                if type == 'dataframes':
+                    received = str(sock.recv(8192), "utf-8")
+                    t = recv.lap(t)
+                    stats.count('bytes', len(received))
+                    a = pd.read_json(StringIO(received))
+                    t = decode.lap(t)
+        
+                elif type == 'singlerows':
+                    received = str(sock.recv(8192), "utf-8")
+                    t = recv.lap(t)
+                    stats.count('bytes', len(received))
+                    matches = re.findall(regex_last_bar, received)
+                    last_bar = matches[0][-1]
+                    lost = len(matches[0]) - 2 if len(matches[0][0]) == 0 else len(matches[0]) - 1
+                    total_lost += lost
+                    a = pd.read_json(StringIO(last_bar), typ='series')
+                    a = a.to_frame()
+                    t = decode.lap(t)
+
+                    # here data is given to the trader to make a decision
+                    trader.generate_signal(a.T)
+                    t = signal.lap(t)
+                    stats.count('bars')
+
+            except Exception as e:
+                # these prints are for debugging
+                print(e)
+                print(received)
+                print(matches)
+                break
+
+# time it took to complete
+t2 = time.time()
+print(t2-t1)
+
+# Cash + value of holdings by the end of simulation
+print(trader.get_wealth())
+
+print(total_lost)
+
+if recorder is not None:
+    recorder.flush()
+
+if stats_path:
+    print(stats.report())
+    stats.dump(stats_path)
+    
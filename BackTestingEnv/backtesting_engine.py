@@ -0,0 +1,76 @@
+import numpy as np
+import backtesting_server
+from backtesting_server import ReplayDataset
+from pipeline_stats import NullStats
+
+# In process alternative to the backtesting client/server pair
+# bars are read from the same record batches the server would send, in the same
+# order (files sorted by the date parsed with fname_parser), and handed to the
+# strategy as light row views of the batch, so no socket, json or dataframe is involved
+
+class BarView:
+    '''
+    One bar of a record batch, indexed like a one row dataframe (bar['close'][0])
+    Columns are converted to python lists once per batch, so the strategy works
+        on plain floats and strings instead of numpy scalars
+    '''
+    __slots__ = ('columns', 'i')
+
+    def __init__(self, records):
+        self.columns = {}
+        for name in records.dtype.names:
+            col = records[name]
+            if col.dtype.kind == 'M':
+                col = col.astype('datetime64[us]') # tolist gives datetimes instead of ns integers
+            self.columns[name] = col.tolist()
+        self.i = 0
+
+    def __getitem__(self, name):
+        return (self.columns[name][self.i],)
+
+class BacktestEngine:
+    '''
+    Event driven backtest engine that calls strategy.generate_signal for every bar
+    Any object with generate_signal(data) and get_wealth() works as a strategy,
+        data is a BarView indexed like data['close'][0]
+    '''
+
+    def __init__(self, directory=None, regex=None, dataset=None):
+        '''
+        directory - directory of replay files, defaults to the server's
+        regex - file name regex, defaults to the server's
+        dataset - already loaded ReplayDataset, skips reading the directory
+        '''
+        if dataset is None:
+            directory = directory or backtesting_server.directory
+            regex = regex or backtesting_server.regex
+            dataset = ReplayDataset(directory, regex)
+        self.dataset = dataset
+
+    def batches(self):
+        # record batches in replay order
+        for file in self.dataset.files:
+            for _, records in self.dataset.read(file):
+                yield records
+
+    def run(self, strategy, record_wealth=True, stats=None):
+        # replays every bar through the strategy, returns the wealth after each bar
+        # (kept per batch, streamed files have no row count up front)
+        # stats - optional PipelineStats, times reading each batch (read) and every generate_signal call (signal)
+        stats = stats or NullStats()
+        read, signal = stats.stage('read'), stats.stage('signal')
+        wealth = []
+        t = stats.start()
+        for records in self.batches():
+            bar = BarView(records)
+            path = np.empty(len(records) if record_wealth else 0)
+            t = read.lap(t)
+            for j in range(len(records)):
+                bar.i = j
+                strategy.generate_signal(bar)
+                t = signal.lap(t)
+                if record_wealth:
+                    path[j] = strategy.get_wealth()
+            wealth.append(path)
+            stats.count('bars', len(records))
+        return np.concatenate(wealth) if wealth else np.empty(0)
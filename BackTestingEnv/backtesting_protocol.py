@@ -0,0 +1,116 @@
+import json
+import socket
+import struct
+import numpy as np
+import pandas as pd
+
+# Wire format shared by backtesting_server and backtesting_client
+# every message is a frame: fixed size header, small json meta block, raw body
+# header is kind (1 byte), meta length (4 bytes), body length (8 bytes) in network byte order
+# bars travel in batches as the raw bytes of a numpy structured array, the dtype is
+# described in the meta block so the receiver can decode with np.frombuffer (no copies)
+
+FRAME_HEADER = struct.Struct('!BIQ')
+
+# frame kinds
+BATCH = 1 # server -> client, body is a record batch
+CONFIG = 2 # client -> server, meta is the run configuration
+ACK = 3 # client -> server, batch has been consumed
+END = 4 # server -> client, replay finished
+ERROR = 5 # server -> client, replay failed, meta error is the reason
+
+def df_to_records(df):
+    # converts a dataframe into a numpy structured array with fixed width fields
+    # strings become unicode fields, timezone aware timestamps are converted to UTC
+    fields = []
+    columns = []
+    for name in df.columns:
+        col = df[name]
+        if pd.api.types.is_datetime64_any_dtype(col):
+            if col.dt.tz is not None:
+                col = col.dt.tz_convert('UTC').dt.tz_localize(None)
+            values = col.to_numpy(dtype='datetime64[ns]')
+        elif pd.api.types.is_bool_dtype(col) or pd.api.types.is_numeric_dtype(col):
+            values = col.to_numpy()
+            if values.dtype == object:
+                values = values.astype(float)
+        else:
+            values = col.astype(str).to_numpy(dtype=str)
+        fields.append((str(name), values.dtype))
+        columns.append(values)
+
+    records = np.empty(len(df), dtype=fields)
+    for (name, _), values in zip(fields, columns):
+        records[name] = values
+
+    return records
+
+def set_nodelay(sock):
+    # small frames (acks, short batches) must not wait on Nagle's algorithm
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+def send_frame(sock, kind, meta=None, body=None):
+    # body may be anything exposing the buffer protocol, large bodies are sent without copying
+    meta = json.dumps(meta or {}).encode('utf-8')
+    body = memoryview(body if body is not None else b'')
+    head = FRAME_HEADER.pack(kind, len(meta), body.nbytes) + meta
+    if body.nbytes <= 65536:
+        sock.sendall(head + body)
+    else:
+        sock.sendall(head)
+        sock.sendall(body)
+
+def send_batch(sock, records, **meta):
+    # sends a structured array as one frame, extra keyword arguments go in the meta block
+    records = np.ascontiguousarray(records)
+    meta['dtype'] = records.dtype.descr
+    meta['rows'] = len(records)
+    send_frame(sock, BATCH, meta, records.view(np.uint8))
+
+class FrameReader:
+    '''
+    Reads frames off a socket
+    Bodies are received straight into a fresh buffer with recv_into and record
+        batches are views over that buffer, so they stay valid after the next read
+    '''
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.dtypes = {} # dtype cache keyed by the json descr string
+        self.bytes_received = 0
+
+    def recv_exactly(self, n):
+        buf = bytearray(n)
+        view = memoryview(buf)
+        received = 0
+        while received < n:
+            count = self.sock.recv_into(view[received:], n - received)
+            if count == 0:
+                raise ConnectionError('socket closed in the middle of a frame')
+            received += count
+        self.bytes_received += n
+        return buf
+
+    def recv_frame(self):
+        # returns kind, meta dict and raw body
+        kind, meta_len, body_len = FRAME_HEADER.unpack(self.recv_exactly(FRAME_HEADER.size))
+        meta = json.loads(self.recv_exactly(meta_len)) if meta_len else {}
+        body = self.recv_exactly(body_len)
+        return kind, meta, body
+
+    def decode_batch(self, meta, body):
+        # zero copy decode of a record batch
+        key = json.dumps(meta['dtype'])
+        dtype = self.dtypes.get(key)
+        if dtype is None:
+            dtype = np.dtype([tuple(field) for field in meta['dtype']])
+            self.dtypes[key] = dtype
+        return np.frombuffer(body, dtype=dtype)
+
+    def recv_batch(self):
+        # returns kind, meta and the decoded batch (None for non batch frames)
+        kind, meta, body = self.recv_frame()
+        if kind == BATCH:
+            return kind, meta, self.decode_batch(meta, body)
+        return kind, meta, None
@@ -1,70 +1,397 @@
-import socketserver
-import time
-import pandas as pd
-import os
-import re
-from datetime import datetime
-
-# provide a directory of files that will be used simulate real time data
-# for now, file names must include ticker, type, date in that order
-# for now, files must be xlsx
-# use regex to specify format
-# specify interval between sent data in seconds in cycle
-
-cycle = 60
-directory = r"C:\Users\Xzavier\Documents\Data\Options\Citi".replace("\\","/")
-regex = r"^([A-z]{1,5})(_)([A-z]{1,5})(_)([0-9]{2}_[0-9]{2}_[0-9]{4})(.)([A-z]{1,5}$)"
-symbols = '{}()[].,:;+-*/&|<>=~$1234567890_'
-
-def fname_parser(fn, regex, as_string):
-
-    matches = re.findall(regex, fn)
-
-    matches = [m for m in matches[0] if m not in symbols]
-
-    if as_string:
-        return {'fn':fn, 'ticker':matches[0], 'date':matches[2], 'type':matches[1], 'file_ext':matches[3]}
-    else:
-        return {'fn':fn, 'ticker':matches[0], 'date':datetime.strptime(matches[2], '%m_%d_%Y'), 'type':matches[1], 'file_ext':matches[3]}
-
-class MyTCPHandler(socketserver.BaseRequestHandler):
-    """
-    The request handler class for our server.
-
-    It is instantiated once per connection to the server, and must
-    override the handle() method to implement communication to the
-    client.
-    """
-
-    def handle(self):
-        '''# self.request is the TCP socket connected to the client'''
-        dir = os.listdir(directory)
-        dir = [file for file in dir if file[0] != '~']
-        dir_parsed = [fname_parser(fn, regex, False) for fn in dir]
-        dir_parsed.sort(key=lambda x: x['date'])
-
-        for file in dir_parsed:
-            fn = file['fn']
-            fn_path = directory + '/' + fn
-            try:
-                xls = pd.ExcelFile(fn_path)
-                for sheet in xls.sheet_names:
-                    df = pd.read_excel(xls, sheet).drop(columns=['Unnamed: 0', 'Last Trade Date', 'Change', '% Change'])
-                    df_json = bytes(df.to_json(), 'utf-8')
-                    self.request.sendall(df_json)
-                    time.sleep(.01)
-
-                #break #remove later
-
-            except:
-                break
-            time.sleep(cycle)
-
-if __name__ == "__main__":
-    HOST, PORT = "localhost", 9999 #localhost or 127.0.0.1
-
-    # Create the server, binding to localhost on port 9999
-    with socketserver.TCPServer((HOST, PORT), MyTCPHandler) as server:
-        # Activate the server; this will keep running until you
-        # interrupt the program with Ctrl-C
-        server.serve_forever()
+import socketserver
+import time
+import pandas as pd
+import os
+import re
+from datetime import datetime
+from backtesting_protocol import df_to_records, send_batch, send_frame, set_nodelay, FrameReader, CONFIG, ACK, END, ERROR
+from replay_cache import ReplayCache
+from replay_merge import merge_streams, concat_records
+from pipeline_stats import PipelineStats, NullStats, dump_on_signal
+from bar_aggregation import BarAggregator
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# provide a directory of files that will be used simulate real time data
+# for now, file names must include ticker, type, date in that order
+# files can be xlsx workbooks (every sheet is loaded at once) or csv, parquet and feather
+#   files, which are never loaded whole: they are read chunk_size rows at a time and every
+#   chunk is sent as soon as it is read, so server memory does not grow with the file size
+#   (parquet and feather need pyarrow)
+# use regex to specify format
+# specify interval between sent data in seconds in cycle
+# wire_format chooses how sheets are sent:
+#   'binary' - length prefixed record batches (see backtesting_protocol), client sends its config first
+#   'json' - raw df.to_json() text, client has to find bar boundaries itself
+# replay_mode (can be overridden by the client config, binary only):
+#   'realtime' - batches are paced with wall clock sleeps of cycle seconds
+#   'lockstep' - next batch is sent only once the client acks the previous one,
+#                cycle only advances a simulated clock so the replay runs as fast as the client
+# cache_directory keeps every converted sheet as a memory mapped .npy file (see replay_cache)
+#   so workbooks are only parsed again when they change, set to None to always parse
+# threaded - serve every connection on its own thread from one ReplayDataset loaded at start up,
+#   otherwise connections are served one at a time and each one reads the directory again
+# merge_tickers (can be overridden by the client config) - instead of replaying one file at a time,
+#   open one stream per ticker and send their rows merged in time_column order (see replay_merge),
+#   cycle is then the pause between merged batches of merge_batch_size rows
+# stats_path - when set, every connection times its stages (see pipeline_stats):
+#   read (loading/parsing the next batch, includes the pacing sleeps in realtime mode),
+#   serialize (json only), send and ack (lockstep wait for the client), and counts bars and bytes sent
+#   connections are merged into server_stats, dumped as json to stats_path after every
+#   connection and whenever the server receives SIGUSR1
+# timeframes (can be overridden by the client config, binary only) - pandas frequencies such as
+#   ['1min', '5min', '1h'], rows are aggregated into OHLCV/VWAP bars of every timeframe as they are
+#   read (see bar_aggregation) and only completed bars are sent, each batch tagged with its timeframe,
+#   set send_rows in the client config to also send the rows themselves
+#   aggregation time is part of the read stage
+# every batch carries its position (file, sheet and first row, or merged row count) so a client
+#   can checkpoint and later resume by sending that position as 'start' in its config (see checkpoint)
+
+cycle = 60
+directory = r"C:\Users\Xzavier\Documents\Data\Options\Citi".replace("\\","/")
+regex = r"^([A-z]{1,5})(_)([A-z]{1,5})(_)([0-9]{2}_[0-9]{2}_[0-9]{4})(.)([A-z]{1,7}$)"
+symbols = '{}()[].,:;+-*/&|<>=~$1234567890_'
+wire_format = 'binary'
+replay_mode = 'realtime'
+cache_directory = directory.rstrip('/') + '_cache'
+threaded = True
+merge_tickers = False
+time_column = 'timestamp'
+merge_batch_size = 4096
+chunk_size = 65536
+stats_path = None
+timeframes = []
+
+server_stats = PipelineStats('server')
+
+def fname_parser(fn, regex, as_string):
+
+    matches = re.findall(regex, fn)
+
+    matches = [m for m in matches[0] if m not in symbols]
+
+    if as_string:
+        return {'fn':fn, 'ticker':matches[0], 'date':matches[2], 'type':matches[1], 'file_ext':matches[3]}
+    else:
+        return {'fn':fn, 'ticker':matches[0], 'date':datetime.strptime(matches[2], '%m_%d_%Y'), 'type':matches[1], 'file_ext':matches[3]}
+
+def replay_files(directory, regex):
+    # lists the files of a directory in the order they are replayed (by parsed date)
+    dir = os.listdir(directory)
+    dir = [file for file in dir if file[0] != '~']
+    dir_parsed = [fname_parser(fn, regex, False) for fn in dir]
+    dir_parsed.sort(key=lambda x: x['date'])
+    return dir_parsed
+
+dropped_columns = ['Unnamed: 0', 'Last Trade Date', 'Change', '% Change']
+
+def load_sheet(xls, sheet):
+    # reads one sheet of a workbook and drops the columns that are not replayed
+    return pd.read_excel(xls, sheet).drop(columns=dropped_columns)
+
+def convert_workbook(path):
+    # reads every sheet of a workbook into record batches
+    xls = pd.ExcelFile(path)
+    return [(sheet, df_to_records(load_sheet(xls, sheet))) for sheet in xls.sheet_names]
+
+def workbook_records(path):
+    # record batches of a workbook, from the cache when one is configured
+    if cache_directory:
+        return ReplayCache(cache_directory, convert_workbook).load(path)
+    return convert_workbook(path)
+
+def csv_chunks(path, size):
+    # pandas reads size rows at a time, time_column is parsed as dates when present
+    header = pd.read_csv(path, nrows=0).columns
+    dates = [time_column] if time_column in header else False
+    for df in pd.read_csv(path, chunksize=size, parse_dates=dates):
+        yield df_to_records(df.drop(columns=dropped_columns, errors='ignore'))
+
+def parquet_chunks(path, size):
+    # decodes batches of a row group as they are needed, pre_buffer would read ahead the whole file
+    for batch in pq.ParquetFile(path, pre_buffer=False).iter_batches(batch_size=size):
+        yield df_to_records(batch.to_pandas().drop(columns=dropped_columns, errors='ignore'))
+
+def feather_chunks(path, size):
+    # feather (v2) files are arrow ipc files, read one record batch at a time
+    # (not memory mapped, mapped pages would count towards the server's memory as the replay goes on)
+    with pa.OSFile(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield df_to_records(reader.get_batch(i).to_pandas().drop(columns=dropped_columns, errors='ignore'))
+
+chunk_readers = {'.csv': csv_chunks, '.parquet': parquet_chunks, '.feather': feather_chunks}
+
+def streamed(fn):
+    # files read in chunks rather than loaded whole
+    return os.path.splitext(fn)[1].lower() in chunk_readers
+
+def rebatch(batches, size):
+    # regroups record batches of any length into batches of exactly size rows (the last one may be shorter)
+    pending = []
+    rows = 0
+    for records in batches:
+        while len(records):
+            take = min(size - rows, len(records))
+            pending.append(records[:take])
+            records = records[take:]
+            rows += take
+            if rows == size:
+                yield pending[0] if len(pending) == 1 else concat_records(pending)
+                pending = []
+                rows = 0
+    if rows:
+        yield pending[0] if len(pending) == 1 else concat_records(pending)
+
+def file_chunks(path, size=None):
+    # (chunk name, record array) pairs of a csv, parquet or feather file, read lazily
+    size = size or chunk_size
+    reader = chunk_readers[os.path.splitext(path)[1].lower()]
+    for i, records in enumerate(rebatch(reader(path, size), size)):
+        yield 'chunk%d' % i, records
+
+class ReplayDataset:
+    '''
+    Record batches of a replay directory, loaded once and shared read only
+        by every connection of a ReplayServer
+    '''
+
+    def __init__(self, directory=None, regex=None):
+        self.directory = directory
+        self.files = [] # parsed file names in replay order
+        self.sheets = {} # file name -> list of (sheet name, record array), streamed files are not held
+        if directory is not None:
+            for file in replay_files(directory, regex):
+                if streamed(file['fn']):
+                    # read in chunks by every connection that replays it
+                    self.files.append(file)
+                else:
+                    self.add(file, workbook_records(directory + '/' + file['fn']))
+
+    def add(self, file, sheets):
+        # arrays are frozen so no connection can modify what the others replay
+        for _, records in sheets:
+            records.flags.writeable = False
+        self.files.append(file)
+        self.sheets[file['fn']] = sheets
+
+    def read(self, file):
+        # record batches of one file, streamed files are read chunk by chunk on every call
+        sheets = self.sheets.get(file['fn'])
+        if sheets is not None:
+            return sheets
+        return file_chunks(self.directory + '/' + file['fn'])
+
+    def rows(self):
+        # rows held in memory, streamed files are not counted
+        return sum(len(records) for sheets in self.sheets.values() for _, records in sheets)
+
+class ReplayServer(socketserver.ThreadingTCPServer):
+    '''
+    Threaded server, every connection replays the shared dataset at its own pace
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler, dataset):
+        self.dataset = dataset
+        super().__init__(server_address, handler)
+
+class WallClock:
+    # paces the replay in real time
+    def now(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class SimulatedClock:
+    # clock for lockstep replays, sleeping only moves simulated time forward
+    def __init__(self, start=0.0):
+        self.t = start
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += seconds
+
+class MyTCPHandler(socketserver.BaseRequestHandler):
+    """
+    The request handler class for our server.
+
+    It is instantiated once per connection to the server, and must
+    override the handle() method to implement communication to the
+    client.
+    """
+
+    def handle(self):
+        '''# self.request is the TCP socket connected to the client'''
+        config = {}
+        if wire_format == 'binary':
+            # first frame from the client is its configuration
+            set_nodelay(self.request)
+            reader = FrameReader(self.request)
+            kind, config, _ = reader.recv_frame()
+            if kind != CONFIG:
+                return
+        pause = config.get('cycle', cycle)
+        lockstep = wire_format == 'binary' and config.get('replay_mode', replay_mode) == 'lockstep'
+        clock = SimulatedClock() if lockstep else WallClock()
+        merge = config.get('merge_tickers', merge_tickers)
+        start = config.get('start') # resume position from a client checkpoint
+        batches = self.merged_batches(clock, pause, start) if merge else self.file_batches(clock, pause, start)
+        bar_timeframes = config.get('timeframes', timeframes) if wire_format == 'binary' else []
+        if bar_timeframes:
+            batches = self.aggregated_batches(batches, bar_timeframes, config.get('send_rows', False))
+        seq = 0
+
+        stats = PipelineStats('connection') if stats_path else NullStats()
+        read, serialize, send, ack = [stats.stage(stage) for stage in ('read', 'serialize', 'send', 'ack')]
+        t = stats.start()
+        try:
+            for meta, records in batches:
+                t = read.lap(t)
+                if wire_format == 'binary':
+                    send_batch(self.request, records, seq=seq, clock=clock.now(), **meta)
+                    t = send.lap(t)
+                    seq += 1
+                    if lockstep:
+                        # backpressure, wait until the client has consumed the batch
+                        kind, _, _ = reader.recv_frame()
+                        t = ack.lap(t)
+                        if kind != ACK:
+                            return
+                    stats.count('bytes_sent', records.nbytes)
+                else:
+                    df_json = bytes(pd.DataFrame(records).to_json(), 'utf-8')
+                    t = serialize.lap(t)
+                    self.request.sendall(df_json)
+                    t = send.lap(t)
+                    stats.count('bytes_sent', len(df_json))
+                    clock.sleep(.01)
+                stats.count('bars_sent', len(records))
+                stats.count('batches_sent')
+        except ValueError as e:
+            # the replay cannot go on (a resume position not in the data), the client is told why
+            if wire_format == 'binary':
+                send_frame(self.request, ERROR, {'error': str(e)})
+            return
+        except:
+            return
+        finally:
+            if stats_path:
+                stats.count('connections')
+                server_stats.merge(stats)
+                server_stats.dump(stats_path)
+
+        if wire_format == 'binary':
+            send_frame(self.request, END)
+
+    def replay_order(self):
+        # servers holding a dataset share it, otherwise the directory is read for this connection
+        dataset = getattr(self.server, 'dataset', None)
+        files = dataset.files if dataset is not None else replay_files(directory, regex)
+        return dataset, files
+
+    def sheets(self, dataset, file):
+        # record batches of one file, loaded lazily when there is no shared dataset
+        # and read chunk by chunk for csv, parquet and feather files
+        if dataset is not None:
+            return dataset.read(file)
+        path = directory + '/' + file['fn']
+        if streamed(file['fn']):
+            return file_chunks(path)
+        return workbook_records(path)
+
+    def file_batches(self, clock, pause, start=None):
+        # one file at a time in date order, pausing cycle seconds between files
+        # start - resume position {'file', 'sheet', 'row'}, everything before it is skipped
+        # meta row is the index of the batch's first row in its sheet
+        # a resume position that is not in the data raises ValueError, nothing would be replayed
+        dataset, files = self.replay_order()
+        if start is not None and start.get('file') not in [file['fn'] for file in files]:
+            raise ValueError('resume file not found: %r' % start.get('file'))
+        for file in files:
+            fn = file['fn']
+            if start is not None and fn != start['file']:
+                continue
+            try:
+                sheets = self.sheets(dataset, file)
+            except:
+                break
+            for sheet, records in sheets:
+                row = 0
+                if start is not None:
+                    if sheet != start['sheet']:
+                        continue
+                    row = start['row']
+                    records = records[row:]
+                    start = None
+                if len(records):
+                    yield {'file': fn, 'sheet': sheet, 'row': row}, records
+            clock.sleep(pause)
+        if start is not None:
+            raise ValueError('resume sheet %r not found in %r' % (start.get('sheet'), start['file']))
+
+    def merged_batches(self, clock, pause, start=None):
+        # every ticker's files as one lazy stream, rows merged across tickers by timestamp
+        # start - resume position {'merged': True, 'row'}, the first row merged rows are skipped
+        # meta row is the number of merged rows before the batch
+        dataset, files = self.replay_order()
+        by_ticker = {}
+        for file in files:
+            by_ticker.setdefault(file['ticker'], []).append(file)
+
+        def ticker_stream(ticker_files):
+            for file in ticker_files:
+                for _, records in self.sheets(dataset, file):
+                    yield records
+
+        streams = [ticker_stream(ticker_files) for ticker_files in by_ticker.values()]
+        skip = start['row'] if start is not None else 0
+        row = 0
+        for records in merge_streams(streams, time_column, merge_batch_size):
+            row += len(records)
+            if row <= skip:
+                continue
+            if row - len(records) < skip:
+                records = records[skip - (row - len(records)):]
+            yield {'merged': True, 'row': row - len(records)}, records
+            clock.sleep(pause)
+        if row < skip:
+            raise ValueError('resume row %d is past the %d merged rows' % (skip, row))
+
+    def aggregated_batches(self, batches, bar_timeframes, send_rows=False):
+        # completed bars of every timeframe instead of (or after) the rows they were built from
+        # bars carry the position of the batch that completed them and their timeframe
+        aggregator = BarAggregator(bar_timeframes, time_column)
+        meta = None
+        for meta, records in batches:
+            if send_rows:
+                yield meta, records
+            for timeframe, bars in aggregator.update(records):
+                yield dict(meta, timeframe=timeframe), bars
+        for timeframe, bars in aggregator.flush():
+            yield dict(meta, timeframe=timeframe), bars
+
+if __name__ == "__main__":
+    HOST, PORT = "localhost", 9999 #localhost or 127.0.0.1
+
+    # Create the server, binding to localhost on port 9999
+    if threaded:
+        server = ReplayServer((HOST, PORT), MyTCPHandler, ReplayDataset(directory, regex))
+    else:
+        server = socketserver.TCPServer((HOST, PORT), MyTCPHandler)
+
+    if stats_path:
+        dump_on_signal(server_stats, stats_path)
+
+    with server:
+        # Activate the server; this will keep running until you
+        # interrupt the program with Ctrl-C
+        server.serve_forever()
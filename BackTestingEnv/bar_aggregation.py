@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from replay_merge import time_keys
+
+# Incremental OHLCV/VWAP aggregation of replayed rows into bars of several timeframes
+# every batch is folded into the open bar of each (symbol, timeframe) with grouped numpy
+# reductions, a bar is complete (and returned) once a row of the same symbol falls in a
+# later bucket, bars still open at the end of the replay are returned by flush
+# rows of one symbol must be in time order, which both server replay orders guarantee
+
+bar_fields = ['open', 'high', 'low', 'close', 'volume', 'vwap']
+
+class TimeframeBars:
+    '''
+    Open bar of every symbol for one timeframe, in arrays indexed by symbol id
+    volume sums the volume column (rows count 1 each when there is none),
+        vwap weights prices by volume
+    '''
+
+    def __init__(self, name, step, capacity=64):
+        self.name = name
+        self.step = step # bucket width in ticks of the time column (ns for datetimes)
+        self.bucket = np.full(capacity, np.iinfo(np.int64).min) # min marks no open bar
+        self.values = np.zeros((capacity, 7)) # open, high, low, close, volume, price*volume, rows
+
+    def grow(self, capacity):
+        if capacity > len(self.bucket):
+            size = max(capacity, 2*len(self.bucket))
+            self.bucket = np.concatenate((self.bucket, np.full(size - len(self.bucket), np.iinfo(np.int64).min)))
+            self.values = np.concatenate((self.values, np.zeros((size - len(self.values), 7))))
+
+    def update(self, sids, keys, price, volume):
+        # rows must be grouped by symbol (stable order within a symbol), returns completed
+        # bars as (sids, buckets, values)
+        n = len(sids)
+        bucket = keys//self.step
+        start = np.flatnonzero(np.concatenate(([True], (sids[1:] != sids[:-1]) | (bucket[1:] != bucket[:-1]))))
+        end = np.append(start[1:], n)
+        seg_sid = sids[start]
+        seg_bucket = bucket[start]
+        seg = np.empty((len(start), 7))
+        seg[:, 0] = price[start]
+        seg[:, 1] = np.maximum.reduceat(price, start)
+        seg[:, 2] = np.minimum.reduceat(price, start)
+        seg[:, 3] = price[end - 1]
+        seg[:, 4] = np.add.reduceat(volume, start)
+        seg[:, 5] = np.add.reduceat(price*volume, start)
+        seg[:, 6] = end - start
+
+        first = np.concatenate(([True], seg_sid[1:] != seg_sid[:-1]))
+        last = np.append(seg_sid[1:] != seg_sid[:-1], True)
+
+        # the first segment of a symbol either continues its open bar or closes it
+        open_sid = seg_sid[first]
+        has_open = self.bucket[open_sid] != np.iinfo(np.int64).min
+        same = has_open & (self.bucket[open_sid] == seg_bucket[first])
+        closed_sid = open_sid[has_open & ~same]
+        closed = (closed_sid, self.bucket[closed_sid], self.values[closed_sid])
+
+        continued = np.flatnonzero(first)[same]
+        previous = self.values[open_sid[same]]
+        seg[continued, 0] = previous[:, 0]
+        seg[continued, 1] = np.maximum(seg[continued, 1], previous[:, 1])
+        seg[continued, 2] = np.minimum(seg[continued, 2], previous[:, 2])
+        seg[continued, 4:] += previous[:, 4:]
+
+        # the last segment of every symbol stays open, the ones before it are complete
+        self.bucket[seg_sid[last]] = seg_bucket[last]
+        self.values[seg_sid[last]] = seg[last]
+        done = ~last
+        return (np.concatenate((closed[0], seg_sid[done])), np.concatenate((closed[1], seg_bucket[done])),
+                np.concatenate((closed[2], seg[done])))
+
+    def flush(self):
+        # every open bar, the state is cleared
+        sids = np.flatnonzero(self.bucket != np.iinfo(np.int64).min)
+        out = (sids, self.bucket[sids].copy(), self.values[sids].copy())
+        self.bucket[sids] = np.iinfo(np.int64).min
+        return out
+
+class BarAggregator:
+    '''
+    Aggregates record batches into bars of several timeframes at once
+    update(records) returns a list of (timeframe, bars) with the bars each batch completed,
+        bars are record arrays with symbol, timestamp (bucket start), open, high, low,
+        close, volume, vwap and rows, ordered by timestamp then symbol
+    '''
+
+    def __init__(self, timeframes, time_column='timestamp', price_column='close',
+                 volume_column='volume', symbol_column='symbol'):
+        '''
+        timeframes - pandas frequency strings ('1min', '5min', '1h', ...)
+        time_column must hold datetimes, symbol_column and volume_column may be missing
+        '''
+        self.time_column = time_column
+        self.price_column = price_column
+        self.volume_column = volume_column
+        self.symbol_column = symbol_column
+        self.frames = [TimeframeBars(timeframe, pd.Timedelta(timeframe).value) for timeframe in timeframes]
+        self.ids = {} # symbol -> sid
+        self.symbols = []
+        self.time_dtype = np.dtype('M8[ns]')
+
+    def symbol_ids(self, symbols):
+        # interns the symbols of a batch, one dictionary lookup per distinct symbol
+        unique, inverse = np.unique(symbols, return_inverse=True)
+        ids = np.empty(len(unique), dtype=np.int64)
+        for i, symbol in enumerate(unique.tolist()):
+            sid = self.ids.get(symbol)
+            if sid is None:
+                sid = self.ids[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            ids[i] = sid
+        return ids[inverse]
+
+    def update(self, records):
+        if len(records) == 0:
+            return []
+        names = records.dtype.names
+        times = records[self.time_column]
+        if times.dtype.kind == 'M':
+            # keys are in ns like the timeframe steps whatever the unit of the records (M8[us]
+            # from many pandas readers), bars are stamped back in the records' unit
+            self.time_dtype = times.dtype
+            keys = times.astype('M8[ns]').view(np.int64)
+        else:
+            keys = time_keys(records, self.time_column).astype(np.int64)
+        price = records[self.price_column].astype(float)
+        volume = records[self.volume_column].astype(float) if self.volume_column in names else np.ones(len(records))
+        if self.symbol_column in names:
+            sids = self.symbol_ids(records[self.symbol_column])
+            order = np.argsort(sids, kind='stable')
+            sids, keys, price, volume = sids[order], keys[order], price[order], volume[order]
+        else:
+            sids = np.zeros(len(records), dtype=np.int64)
+            self.symbol_ids(np.array(['']))
+        for frame in self.frames:
+            frame.grow(len(self.symbols))
+
+        out = []
+        for frame in self.frames:
+            bars = self.to_records(frame, *frame.update(sids, keys, price, volume))
+            if len(bars):
+                out.append((frame.name, bars))
+        return out
+
+    def flush(self):
+        out = []
+        for frame in self.frames:
+            bars = self.to_records(frame, *frame.flush())
+            if len(bars):
+                out.append((frame.name, bars))
+        return out
+
+    def to_records(self, frame, sids, buckets, values):
+        order = np.lexsort((sids, buckets))
+        sids, buckets, values = sids[order], buckets[order], values[order]
+        width = max([len(symbol) for symbol in self.symbols] + [1])
+        bars = np.empty(len(sids), dtype=[('symbol', 'U%d' % width), ('timestamp', self.time_dtype)]
+                        + [(name, float) for name in bar_fields] + [('rows', np.int64)])
+        bars['symbol'] = np.array(self.symbols + [''])[sids] if len(sids) else []
+        bars['timestamp'] = (buckets*frame.step).view('M8[ns]').astype(self.time_dtype)
+        for j, name in enumerate(['open', 'high', 'low', 'close', 'volume']):
+            bars[name] = values[:, j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bars['vwap'] = values[:, 5]/values[:, 4]
+        bars['rows'] = values[:, 6]
+        return bars
@@ -0,0 +1,97 @@
+import os
+import pickle
+import threading
+import time
+import zlib
+
+# Checkpoints of long backtest runs
+# a checkpoint is the replay position (file, sheet and row of the next bar, or the
+# row count of a merged replay) and the strategy state (Trader.get_state, plain python values)
+# the state is taken and pickled in the hot loop so it is consistent with the position,
+# compressing and writing the file is left to a background thread, and when writes
+# fall behind only the latest snapshot is kept
+
+class Checkpointer:
+    '''
+    Periodic snapshots of a backtest run, written atomically to path
+    Call due(rows) on every bar (an integer comparison) and save when it is True
+    '''
+
+    def __init__(self, path, every_rows=100000, every_seconds=None):
+        '''
+        path - checkpoint file, replaced by every save
+        every_rows - bars between snapshots
+        every_seconds - also snapshot when that much wall time passed, checked at every_rows/100 bar intervals
+        '''
+        self.path = path
+        self.every_rows = every_rows
+        self.every_seconds = every_seconds
+        self.step = every_rows if every_seconds is None else max(1, every_rows//100)
+        self.next_rows = self.step
+        self.last_time = time.time()
+        self.last_rows = 0
+        self.latest = None # pickled snapshot waiting to be written
+        self.saves = 0
+        self.written = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+
+    def due(self, rows):
+        if rows < self.next_rows:
+            return False
+        self.next_rows = rows + self.step
+        if rows - self.last_rows >= self.every_rows:
+            return True
+        return self.every_seconds is not None and time.time() - self.last_time >= self.every_seconds
+
+    def save(self, rows, position, state):
+        # rows - bars processed, position - where the replay resumes, state - strategy state
+        data = pickle.dumps({'rows': rows, 'position': position, 'state': state, 'time': time.time()},
+                            pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.latest = data
+        self.saves += 1
+        self.last_rows = rows
+        self.last_time = time.time()
+        self.wake.set()
+
+    def writer(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            with self.lock:
+                data, self.latest = self.latest, None
+            if data is not None:
+                write_checkpoint(self.path, zlib.compress(data, 1))
+                self.written += 1
+            if self.closed and self.latest is None:
+                return
+
+    def close(self):
+        # waits until the last snapshot is on disk
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+
+def write_checkpoint(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+def load_checkpoint(path):
+    # dict with rows, position, state and time, None when there is no checkpoint
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.loads(zlib.decompress(f.read()))
+
+def batch_position(meta, row):
+    # replay position of the row after row in a batch received with meta
+    if meta.get('merged'):
+        return {'merged': True, 'row': meta['row'] + row + 1}
+    return {'file': meta['file'], 'sheet': meta['sheet'], 'row': meta['row'] + row + 1}
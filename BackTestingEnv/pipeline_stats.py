@@ -0,0 +1,209 @@
+import os
+import json
+import signal
+import threading
+import time
+import numpy as np
+from time import perf_counter_ns
+
+# Per stage latency instrumentation for the backtest pipeline
+# every stage (file parsing, socket send, frame receive, batch decode, generate_signal, ...)
+# keeps a log linear latency histogram in nanoseconds, counters track bytes and bars
+# timing a stage is one perf_counter_ns call and one list append:
+#     send = stats.stage('send')
+#     t = stats.start()
+#     ... work ...
+#     t = send.lap(t) # records the time since t and returns the new start
+# NullStats has the same methods and does nothing, so disabled instrumentation costs a method call
+
+class LatencyHistogram:
+    '''
+    HDR style histogram of integer latencies
+    Values below 2**(sub_bucket_bits+1) get their own bucket, above that every power of two
+        is split into 2**sub_bucket_bits buckets, so the relative error is at most
+        2**-sub_bucket_bits (about 3% with the default 5 bits) whatever the magnitude
+    '''
+
+    def __init__(self, sub_bucket_bits=5, max_bits=44):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.max_value = (1 << max_bits) - 1 # about 4.9 hours in ns, larger values are clamped
+        self.counts = np.zeros(int(self.index(np.array([self.max_value]))[0]) + 1, dtype=np.int64)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, values):
+        # bucket of every value, frexp gives the bit length exactly for values below 2**53
+        _, bits = np.frexp(values.astype(float))
+        shift = np.maximum(bits.astype(np.int64) - self.sub_bucket_bits - 1, 0)
+        return (shift << self.sub_bucket_bits) + (values >> shift)
+
+    def lower_bound(self, i):
+        # smallest value that falls in bucket i
+        shift = (i >> self.sub_bucket_bits) - 1
+        if shift <= 0:
+            return i
+        return (i - (shift << self.sub_bucket_bits)) << shift
+
+    def record(self, values):
+        # adds an array (or list) of latencies
+        values = np.clip(np.asarray(values, dtype=np.int64), 0, self.max_value)
+        if len(values) == 0:
+            return
+        self.counts += np.bincount(self.index(values), minlength=len(self.counts))
+        self.total += len(values)
+        self.sum += int(values.sum())
+        self.max = max(self.max, int(values.max()))
+        low = int(values.min())
+        self.min = low if self.min is None else min(self.min, low)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, p):
+        # lower bound of the bucket holding the p-th percentile (0 to 100)
+        if self.total == 0:
+            return 0
+        rank = max(1, -(-self.total*p//100))
+        i = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(max(self.lower_bound(i), self.min), self.max)
+
+    def summary(self):
+        # microseconds, plus the non empty buckets (lower bound in ns -> count) to compare runs
+        us = 1e-3
+        return {'count': self.total, 'total_s': self.sum*1e-9,
+                'mean_us': self.sum/self.total*us if self.total else 0.0,
+                'min_us': (self.min or 0)*us, 'p50_us': self.percentile(50)*us,
+                'p90_us': self.percentile(90)*us, 'p99_us': self.percentile(99)*us,
+                'p99.9_us': self.percentile(99.9)*us, 'max_us': self.max*us,
+                'buckets': {self.lower_bound(i): int(self.counts[i]) for i in np.flatnonzero(self.counts).tolist()}}
+
+class StageTimer:
+    '''
+    Latencies of one stage, lap only appends to a list that is folded into the
+        histogram every flush_every values (and before any read)
+    '''
+    __slots__ = ('values', 'histogram', 'flush_every')
+
+    def __init__(self, flush_every=8192):
+        self.values = []
+        self.histogram = LatencyHistogram()
+        self.flush_every = flush_every
+
+    def lap(self, start):
+        # records the time since start, returns now so stages can be chained
+        now = perf_counter_ns()
+        values = self.values
+        values.append(now - start)
+        if len(values) >= self.flush_every:
+            self.flush()
+        return now
+
+    def flush(self):
+        values = self.values
+        self.values = []
+        self.histogram.record(values)
+
+class PipelineStats:
+    '''
+    Stage timers and counters (bytes, bars, batches) of one process
+    Hot loops should keep the timer of their stage (stats.stage('signal')) and call
+        its lap, stats.lap looks the timer up by name every call
+    A connection or run can record into its own PipelineStats and merge it into a
+        shared one when done, merge and to_dict take a lock so a signal or another
+        thread can dump while connections are running
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {} # stage -> StageTimer
+        self.counters = {}
+        self.created = time.time()
+        self.lock = threading.RLock()
+
+    def stage(self, stage):
+        timer = self.stages.get(stage)
+        if timer is None:
+            timer = self.stages[stage] = StageTimer()
+        return timer
+
+    def start(self):
+        return perf_counter_ns()
+
+    def lap(self, stage, start):
+        return self.stage(stage).lap(start)
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def merge(self, other):
+        with self.lock:
+            for stage, timer in other.stages.items():
+                timer.flush()
+                self.stage(stage).histogram.merge(timer.histogram)
+            for counter, n in other.counters.items():
+                self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def to_dict(self):
+        with self.lock:
+            elapsed = time.time() - self.created
+            stages = {}
+            for stage, timer in self.stages.items():
+                timer.flush()
+                if timer.histogram.total:
+                    stages[stage] = timer.histogram.summary()
+            rates = {counter: n/elapsed if elapsed > 0 else 0.0 for counter, n in self.counters.items()}
+            return {'name': self.name, 'elapsed_s': elapsed, 'counters': dict(self.counters),
+                    'per_sec': rates, 'stages': stages}
+
+    def dump(self, path):
+        # written to a temporary file first so a reader never sees half a dump
+        with self.lock:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.to_dict(), f, indent=1)
+            os.replace(path + '.tmp', path)
+
+    def report(self):
+        # one line per stage, slowest total first
+        lines = []
+        stages = self.to_dict()['stages']
+        for stage, s in sorted(stages.items(), key=lambda item: -item[1]['total_s']):
+            lines.append('%-10s n=%-9d total %8.3fs  mean %9.2fus  p50 %9.2fus  p99 %9.2fus  max %10.2fus'
+                         % (stage, s['count'], s['total_s'], s['mean_us'], s['p50_us'], s['p99_us'], s['max_us']))
+        return '\n'.join(lines)
+
+class NullTimer:
+    __slots__ = ()
+
+    def lap(self, start):
+        return 0
+
+class NullStats:
+    # same interface as PipelineStats, records nothing
+    def stage(self, stage):
+        return NullTimer()
+
+    def start(self):
+        return 0
+
+    def lap(self, stage, start):
+        return 0
+
+    def count(self, counter, n=1):
+        pass
+
+    def merge(self, other):
+        pass
+
+def dump_on_signal(stats, path, signum=None):
+    # dumps stats to path whenever the process receives signum (SIGUSR1, SIGBREAK on windows)
+    # must be called from the main thread
+    if signum is None:
+        signum = getattr(signal, 'SIGUSR1', None) or getattr(signal, 'SIGBREAK')
+    signal.signal(signum, lambda *_: stats.dump(path))
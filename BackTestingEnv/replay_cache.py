@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+class ReplayCache:
+    '''
+    Persistent cache of converted replay files
+    Every sheet of a workbook is stored once as a .npy structured array and is
+        memory mapped when loaded, so later replays skip the Excel parsing
+    Entries are keyed by the file path and invalidated when its mtime or size changes
+    '''
+
+    def __init__(self, cache_dir, convert):
+        '''
+        cache_dir - directory where converted files are kept
+        convert - function taking a file path and returning a list of (sheet name, record array)
+        '''
+        self.cache_dir = cache_dir
+        self.convert = convert
+
+    def entry_dir(self, path):
+        # one sub directory per source file
+        key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def stamp(self, path):
+        stat = os.stat(path)
+        return {'path': os.path.abspath(path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    def read_index(self, entry):
+        try:
+            with open(os.path.join(entry, 'index.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, path):
+        # returns list of (sheet name, record array), converting the file if the entry is missing or stale
+        entry = self.entry_dir(path)
+        stamp = self.stamp(path)
+        index = self.read_index(entry)
+        if index is None or any(index.get(k) != v for k, v in stamp.items()):
+            return self.store(path, entry, stamp)
+
+        return [(sheet, np.load(os.path.join(entry, fn), mmap_mode='r')) for sheet, fn in index['sheets']]
+
+    def store(self, path, entry, stamp):
+        sheets = self.convert(path)
+        os.makedirs(entry, exist_ok=True)
+
+        # index is removed first and written last so a half written entry is never used
+        index_path = os.path.join(entry, 'index.json')
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        for fn in os.listdir(entry):
+            os.remove(os.path.join(entry, fn))
+
+        index = dict(stamp, sheets=[])
+        for i, (sheet, records) in enumerate(sheets):
+            fn = 'sheet_%d.npy' % i
+            np.save(os.path.join(entry, fn), records, allow_pickle=False)
+            index['sheets'].append((sheet, fn))
+
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+        return sheets
+
+    def clear(self, path=None):
+        # drops the entry of one file, or the whole cache
+        entries = [self.entry_dir(path)] if path else [os.path.join(self.cache_dir, e) for e in os.listdir(self.cache_dir)]
+        for entry in entries:
+            if os.path.isdir(entry):
+                for fn in os.listdir(entry):
+                    os.remove(os.path.join(entry, fn))
+                os.rmdir(entry)
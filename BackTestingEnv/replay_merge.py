@@ -0,0 +1,111 @@
+import numpy as np
+
+# k-way merge of many record batch streams (one per ticker) into a single stream
+# ordered by timestamp
+# every stream is consumed lazily, only the current batch of each stream and the
+# output batch are held in memory, so memory is bounded by the number of streams
+# rather than by the size of the dataset
+# rows of one stream must already be in time order, rows with equal timestamps
+# keep the order of the streams
+
+def time_keys(records, time_column):
+    # sort keys of a batch, datetimes are compared as their int64 ticks
+    values = records[time_column]
+    if values.dtype.kind == 'M':
+        return values.view(np.int64)
+    return values
+
+def common_dtype(dtypes):
+    # structured dtype every batch can be cast to, fields are matched by name
+    first = dtypes[0]
+    fields = []
+    for name in first.names:
+        fields.append((name, np.result_type(*[dtype.fields[name][0] for dtype in dtypes])))
+    return np.dtype(fields)
+
+def concat_records(pieces):
+    # np.concatenate that also accepts batches whose string widths or number types differ
+    dtypes = list({piece.dtype: None for piece in pieces})
+    if len(dtypes) == 1:
+        return np.concatenate(pieces)
+    dtype = common_dtype(dtypes)
+    out = np.empty(sum(len(piece) for piece in pieces), dtype=dtype)
+    pos = 0
+    for piece in pieces:
+        for name in dtype.names:
+            out[name][pos:pos+len(piece)] = piece[name]
+        pos += len(piece)
+    return out
+
+class MergeStream:
+    # buffered rows and read position of one input stream
+    def __init__(self, batches, time_column):
+        self.batches = iter(batches)
+        self.time_column = time_column
+        self.records = None
+        self.keys = None
+        self.pos = 0
+        self.done = False
+
+    def refill(self):
+        # appends the next non empty batch to the unread rows, returns False once nothing is left
+        # only done once at least half the buffer was read, which keeps it under two batches
+        remaining = len(self.records) - self.pos if self.records is not None else 0
+        if self.done or (remaining and remaining > self.pos):
+            return remaining > 0
+        for records in self.batches:
+            if len(records):
+                if remaining:
+                    records = concat_records([self.records[self.pos:], records])
+                self.records = records
+                self.keys = time_keys(records, self.time_column)
+                self.pos = 0
+                return True
+        self.done = True
+        return remaining > 0
+
+def merge_streams(streams, time_column='timestamp', batch_size=4096):
+    '''
+    streams - list of iterables of record arrays, one per ticker
+    time_column - field holding the timestamp of each row
+    batch_size - rows per output batch (the last one may be shorter)
+    yields record arrays of merged rows in timestamp order
+    '''
+    active = []
+    for batches in streams:
+        stream = MergeStream(batches, time_column)
+        if stream.refill():
+            active.append(stream)
+
+    pending = None # merged rows not yet sent
+    while active:
+        # every row up to the earliest last timestamp of the buffered rows is final,
+        # no batch still to be read can hold an earlier row
+        # streams are refilled as soon as half their buffer is read, so on aligned data
+        # (daily files of many tickers) each round covers about a whole file
+        # streams with nothing left to read do not hold anything back
+        waiting = [stream.keys[-1] for stream in active if not stream.done]
+        horizon = min(waiting) if waiting else max(stream.keys[-1] for stream in active)
+
+        pieces = []
+        keys = []
+        for stream in active:
+            end = stream.pos + int(np.searchsorted(stream.keys[stream.pos:], horizon, side='right'))
+            if end > stream.pos:
+                pieces.append(stream.records[stream.pos:end])
+                keys.append(stream.keys[stream.pos:end])
+                stream.pos = end
+
+        # stable sort keeps stream order for equal timestamps
+        order = np.argsort(np.concatenate(keys), kind='stable')
+        merged = concat_records(pieces)[order]
+        pending = merged if pending is None else concat_records([pending, merged])
+
+        while len(pending) >= batch_size:
+            yield pending[:batch_size]
+            pending = pending[batch_size:]
+
+        active = [stream for stream in active if stream.refill()]
+
+    if pending is not None and len(pending):
+        yield pending
@@ -0,0 +1,459 @@
+import os
+import sys
+import json
+import socket
+import resource
+import tempfile
+import shutil
+import threading
+import time
+import multiprocessing
+import tracemalloc
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+from backtesting_protocol import df_to_records, send_batch, send_frame, set_nodelay, FrameReader, BATCH, CONFIG, ACK, END
+from backtesting_server import MyTCPHandler, ReplayServer, ReplayDataset, regex
+from backtesting_engine import BacktestEngine
+from pipeline_stats import PipelineStats, NullStats
+from checkpoint import Checkpointer, load_checkpoint, batch_position
+import backtesting_server
+from replay_merge import merge_streams
+from bar_aggregation import BarAggregator
+from backtest_trad_strat_1 import Trader
+
+# Benchmarks for the backtesting environment
+# run as: python server_benchmarks.py <name>, with no name every benchmark runs
+# a check that fails (lost rows, a different wealth path) raises AssertionError
+
+def check(ok, message):
+    # checks stop the run instead of only being printed (unlike assert, not skipped under -O)
+    if not ok:
+        raise AssertionError(message)
+
+def synthetic_bars(n_bars, symbol='AAPL', seed=0):
+    # minute bars shaped like the stock files replayed by the server
+    rng = np.random.default_rng(seed)
+    close = 150*np.exp(np.cumsum(rng.normal(0, 5e-4, n_bars)))
+    return pd.DataFrame({
+        'symbol': symbol,
+        'timestamp': pd.date_range('2020-01-02 09:30', periods=n_bars, freq='min'),
+        'open': close*(1 + rng.normal(0, 1e-4, n_bars)),
+        'high': close*(1 + np.abs(rng.normal(0, 2e-4, n_bars))),
+        'low': close*(1 - np.abs(rng.normal(0, 2e-4, n_bars))),
+        'close': close,
+        'volume': rng.integers(100, 10000, n_bars).astype(float),
+    })
+
+def bench_framing(n_bars=1000000, batch_size=390):
+    # pushes record batches through a socket pair at cycle = 0 and counts what arrives
+    records = df_to_records(synthetic_bars(n_bars))
+    server, client = socket.socketpair()
+
+    def serve():
+        for start in range(0, n_bars, batch_size):
+            send_batch(server, records[start:start+batch_size])
+        send_frame(server, END)
+
+    t1 = time.time()
+    thread = threading.Thread(target=serve)
+    thread.start()
+
+    reader = FrameReader(client)
+    received = 0
+    checksum = 0
+    while True:
+        kind, meta, batch = reader.recv_batch()
+        if kind == END:
+            break
+        if kind == BATCH:
+            received += len(batch)
+            checksum += batch['close'].sum()
+    t2 = time.time()
+    thread.join()
+    server.close()
+    client.close()
+
+    print('framing: %d bars in %.3fs, %.0f bars/sec, %.1f MB/sec' % (received, t2-t1, received/(t2-t1), reader.bytes_received/(t2-t1)/1e6))
+    print('framing: lost rows', n_bars - received, 'checksum ok', np.isclose(checksum, records['close'].sum()))
+    check(received == n_bars, 'framing: %d rows lost' % (n_bars - received))
+    check(np.isclose(checksum, records['close'].sum()), 'framing: checksum of the received closes differs')
+
+def synthetic_dataset(n_files, sheets_per_file, rows_per_sheet):
+    # in memory dataset laid out like a directory of daily workbooks
+    dataset = ReplayDataset()
+    records = df_to_records(synthetic_bars(n_files*sheets_per_file*rows_per_sheet))
+    for i in range(n_files):
+        sheets = []
+        for j in range(sheets_per_file):
+            start = (i*sheets_per_file + j)*rows_per_sheet
+            sheets.append(('sheet%d' % j, records[start:start+rows_per_sheet].copy()))
+        dataset.add({'fn': 'AAPL_bars_%03d.xlsx' % i, 'ticker': 'AAPL'}, sheets)
+    return dataset
+
+def replay_client(address):
+    # lockstep client that only counts rows, returns rows received
+    with socket.create_connection(address) as sock:
+        set_nodelay(sock)
+        send_frame(sock, CONFIG, {'cycle': 0, 'replay_mode': 'lockstep'})
+        reader = FrameReader(sock)
+        rows = 0
+        while True:
+            kind, meta, batch = reader.recv_batch()
+            if kind == END:
+                return rows
+            rows += len(batch)
+            send_frame(sock, ACK, {'seq': meta['seq']})
+
+def bench_load_test(clients=(1, 4, 16, 32), n_files=50, sheets_per_file=4, rows_per_sheet=390):
+    # N simultaneous lockstep clients against one threaded server sharing a dataset
+    dataset = synthetic_dataset(n_files, sheets_per_file, rows_per_sheet)
+    expected = dataset.rows()
+    server = ReplayServer(('localhost', 0), MyTCPHandler, dataset)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    for n in clients:
+        with multiprocessing.Pool(n) as pool:
+            t1 = time.time()
+            rows = pool.map(replay_client, [server.server_address]*n)
+            t2 = time.time()
+        print('load test: %d clients, %d bars in %.3fs, %.0f bars/sec aggregate, lost rows %d' % (n, sum(rows), t2-t1, sum(rows)/(t2-t1), n*expected - sum(rows)))
+        check(rows == [expected]*n, 'load test: %d clients received %s rows of %d' % (n, rows, expected))
+
+    server.shutdown()
+    server.server_close()
+
+def socket_backtest(address, trader, stats=None):
+    # same loop as the binary lockstep client, returns the wealth after each bar
+    stats = stats or NullStats()
+    recv, decode, signal, ack = [stats.stage(stage) for stage in ('recv', 'decode', 'signal', 'ack')]
+    wealth = []
+    with socket.create_connection(address) as sock:
+        set_nodelay(sock)
+        send_frame(sock, CONFIG, {'cycle': 0, 'replay_mode': 'lockstep'})
+        reader = FrameReader(sock)
+        t = stats.start()
+        while True:
+            kind, meta, body = reader.recv_frame()
+            t = recv.lap(t)
+            if kind == END:
+                stats.count('bytes', reader.bytes_received)
+                return np.array(wealth)
+            batch = reader.decode_batch(meta, body)
+            t = decode.lap(t)
+            for j in range(len(batch)):
+                trader.generate_signal(batch[j:j+1])
+                t = signal.lap(t)
+                wealth.append(trader.get_wealth())
+            stats.count('bars', len(batch))
+            send_frame(sock, ACK, {'seq': meta['seq']})
+            t = ack.lap(t)
+
+def bench_engine(n_files=50, sheets_per_file=4, rows_per_sheet=390):
+    # in process engine against the lockstep socket path and the old json per bar decode
+    dataset = synthetic_dataset(n_files, sheets_per_file, rows_per_sheet)
+    n_bars = dataset.rows()
+
+    t1 = time.time()
+    engine_wealth = BacktestEngine(dataset=dataset).run(Trader(10000, 'AAPL', 5, 90))
+    t2 = time.time()
+    print('engine: %d bars in %.3fs, %.0f bars/sec' % (n_bars, t2-t1, n_bars/(t2-t1)))
+
+    server = ReplayServer(('localhost', 0), MyTCPHandler, dataset)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    t1 = time.time()
+    socket_wealth = socket_backtest(server.server_address, Trader(10000, 'AAPL', 5, 90))
+    t2 = time.time()
+    server.shutdown()
+    server.server_close()
+    print('socket: %d bars in %.3fs, %.0f bars/sec' % (len(socket_wealth), t2-t1, len(socket_wealth)/(t2-t1)))
+    print('engine: same wealth path as socket', np.array_equal(engine_wealth, socket_wealth))
+    check(np.array_equal(engine_wealth, socket_wealth), 'engine: wealth path differs from the socket run')
+
+    # json text per bar, decoded the way the singlerows client does it
+    bars = pd.DataFrame(dataset.sheets[dataset.files[0]['fn']][0][1])
+    texts = [bars.iloc[i].to_json() for i in range(len(bars))]
+    trader = Trader(10000, 'AAPL', 5, 90)
+    t1 = time.time()
+    for text in texts:
+        trader.generate_signal(pd.read_json(StringIO(text), typ='series').to_frame().T)
+    t2 = time.time()
+    print('json: %.0f bars/sec (decode + signal only)' % (len(texts)/(t2-t1)))
+
+def lazy_ticker_stream(ticker, n_files, rows_per_file, seed):
+    # daily files of one ticker generated on demand, irregular timestamps within each day
+    rng = np.random.default_rng(seed)
+    dtype = [('symbol', 'U5'), ('timestamp', 'M8[ns]'), ('close', float)]
+    for day in range(n_files):
+        minutes = np.sort(rng.choice(390*60, rows_per_file, replace=False))
+        records = np.empty(rows_per_file, dtype=dtype)
+        records['symbol'] = ticker
+        records['timestamp'] = np.datetime64('2020-01-02T09:30') + np.timedelta64(day, 'D') + minutes.astype('m8[s]')
+        records['close'] = 100 + rng.normal(0, 1, rows_per_file)
+        yield records
+
+def bench_merge(n_tickers=500, n_files=20, rows_per_file=390, batch_size=4096):
+    # merged replay of many tickers, checks order and row count and tracks peak memory
+    streams = [lazy_ticker_stream('T%d' % i, n_files, rows_per_file, i) for i in range(n_tickers)]
+    tracemalloc.start()
+    t1 = time.time()
+    rows = 0
+    last = np.datetime64('NaT')
+    ordered = True
+    for batch in merge_streams(streams, 'timestamp', batch_size):
+        ordered &= bool(np.all(batch['timestamp'][1:] >= batch['timestamp'][:-1])) and not batch['timestamp'][0] < last
+        last = batch['timestamp'][-1]
+        rows += len(batch)
+    t2 = time.time()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('merge: %d tickers, %d rows in %.3fs, %.0f rows/sec, ordered %s, lost rows %d, peak memory %.1f MB'
+          % (n_tickers, rows, t2-t1, rows/(t2-t1), ordered, n_tickers*n_files*rows_per_file - rows, peak/1e6))
+    check(ordered, 'merge: rows out of timestamp order')
+    check(rows == n_tickers*n_files*rows_per_file, 'merge: %d rows lost' % (n_tickers*n_files*rows_per_file - rows))
+
+def bench_stats(n_files=50, sheets_per_file=4, rows_per_sheet=390, repeat=3):
+    # cost of the stage timers on the engine, then a fully instrumented lockstep socket run
+    dataset = synthetic_dataset(n_files, sheets_per_file, rows_per_sheet)
+    n_bars = dataset.rows()
+    for name, make in [('off', lambda: None), ('on', lambda: PipelineStats('engine'))]:
+        best = None
+        for _ in range(repeat):
+            stats = make()
+            t1 = time.time()
+            BacktestEngine(dataset=dataset).run(Trader(10000, 'AAPL', 5, 90), stats=stats)
+            t2 = time.time()
+            best = min(best or t2-t1, t2-t1)
+        print('stats: engine with stats %-3s %d bars in %.3fs, %.2f us/bar' % (name, n_bars, best, best/n_bars*1e6))
+    print(stats.report())
+
+    path = tempfile.mkdtemp()
+    backtesting_server.stats_path = os.path.join(path, 'server.json')
+    try:
+        server = ReplayServer(('localhost', 0), MyTCPHandler, dataset)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client_stats = PipelineStats('client')
+        socket_backtest(server.server_address, Trader(10000, 'AAPL', 5, 90), client_stats)
+        server.shutdown()
+        server.server_close()
+        client_stats.dump(os.path.join(path, 'client.json'))
+        print('stats: server')
+        print(backtesting_server.server_stats.report())
+        print('stats: client')
+        print(client_stats.report())
+        with open(backtesting_server.stats_path) as f:
+            counters = json.load(f)['counters']
+        print('stats: server counters', counters, 'client counters', client_stats.counters)
+    finally:
+        backtesting_server.stats_path = None
+        shutil.rmtree(path)
+
+def checkpointed_backtest(address, trader, checkpointer=None, rows=0, start=None, merge=False, stop_after=None):
+    # lockstep client loop with checkpoints, stop_after drops the connection after that many bars
+    # without a final save, like a crash, returns the trader and the bars processed
+    config = {'cycle': 0, 'replay_mode': 'lockstep', 'merge_tickers': merge}
+    if start is not None:
+        config['start'] = start
+    with socket.create_connection(address) as sock:
+        set_nodelay(sock)
+        send_frame(sock, CONFIG, config)
+        reader = FrameReader(sock)
+        while True:
+            kind, meta, batch = reader.recv_batch()
+            if kind == END:
+                return trader, rows
+            for j in range(len(batch)):
+                trader.generate_signal(batch[j:j+1])
+                rows += 1
+                if checkpointer is not None and checkpointer.due(rows):
+                    checkpointer.save(rows, batch_position(meta, j), trader.get_state())
+                if rows == stop_after:
+                    return trader, rows
+            send_frame(sock, ACK, {'seq': meta['seq']})
+
+def bench_checkpoint(n_files=50, sheets_per_file=4, rows_per_sheet=390, every_rows=(1000, 10000), repeat=3):
+    # cost of checkpointing (best of repeat full runs), then crash half way, resume from the
+    # last checkpoint and compare with an uninterrupted run
+    dataset = synthetic_dataset(n_files, sheets_per_file, rows_per_sheet)
+    n_bars = dataset.rows()
+    server = ReplayServer(('localhost', 0), MyTCPHandler, dataset)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = tempfile.mkdtemp()
+    fn = os.path.join(path, 'run.ckpt')
+    try:
+        for merge in (False, True):
+            timings = {}
+            for every in (None,) + tuple(every_rows):
+                for _ in range(repeat):
+                    checkpointer = Checkpointer(fn, every) if every else None
+                    t1 = time.time()
+                    reference, _ = checkpointed_backtest(server.server_address, Trader(10000, 'AAPL', 5, 90), checkpointer, merge=merge)
+                    t2 = time.time()
+                    if checkpointer is not None:
+                        checkpointer.close()
+                    timings[every] = min(timings.get(every, t2-t1), t2-t1)
+
+            for every in every_rows:
+                checkpointer = Checkpointer(fn, every)
+                checkpointed_backtest(server.server_address, Trader(10000, 'AAPL', 5, 90), checkpointer, merge=merge, stop_after=n_bars//2 + 123)
+                checkpointer.close()
+
+                checkpoint = load_checkpoint(fn)
+                checkpointer = Checkpointer(fn, every)
+                trader = Trader(10000, 'AAPL', 5, 90)
+                trader.set_state(checkpoint['state'])
+                trader, rows = checkpointed_backtest(server.server_address, trader, checkpointer,
+                                                     checkpoint['rows'], checkpoint['position'], merge)
+                checkpointer.close()
+                same = trader.get_wealth() == reference.get_wealth() and trader.holdings == reference.holdings
+                print('checkpoint: merge %-5s every %5d bars, %.2f us/bar (%.2f without), %d bytes, resumed at row %d, rows %d of %d, same wealth %s'
+                      % (merge, every, timings[every]/n_bars*1e6, timings[None]/n_bars*1e6, os.path.getsize(fn), checkpoint['rows'],
+                         rows, n_bars, same))
+                check(rows == n_bars, 'checkpoint: resumed run processed %d rows of %d' % (rows, n_bars))
+                check(same, 'checkpoint: resumed run ends with a different wealth or holdings')
+                os.remove(fn)
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(path)
+
+def write_bars(path, n_rows, piece=1000000):
+    # large bar file written a piece at a time, csv, parquet or feather by extension
+    ext = os.path.splitext(path)[1]
+    writer = None
+    for start in range(0, n_rows, piece):
+        df = synthetic_bars(min(piece, n_rows - start), seed=start)
+        df['timestamp'] += pd.Timedelta(minutes=start)
+        if ext == '.csv':
+            df.to_csv(path, mode='a', header=start == 0, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema) if ext == '.parquet' else pa.ipc.new_file(path, table.schema)
+            if ext == '.parquet':
+                writer.write_table(table)
+            else:
+                writer.write_table(table, max_chunksize=65536)
+    if writer is not None:
+        writer.close()
+
+def peak_rss():
+    # high water mark of this process, ru_maxrss would include the parent's peak before exec
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM'):
+                return int(line.split()[1])*1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+def replay_directory(path, mode):
+    # runs in a fresh process so peak rss only covers this replay
+    # 'chunked' replays the directory through a server to a counting client,
+    # 'whole' loads the file into one dataframe like a workbook sheet is loaded
+    base = peak_rss()
+    t1 = time.time()
+    if mode == 'chunked':
+        server = ReplayServer(('localhost', 0), MyTCPHandler, ReplayDataset(path, regex))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        rows = replay_client(server.server_address)
+        server.shutdown()
+        server.server_close()
+    else:
+        fn = os.path.join(path, os.listdir(path)[0])
+        readers = {'.csv': pd.read_csv, '.parquet': pd.read_parquet, '.feather': pd.read_feather}
+        rows = len(df_to_records(readers[os.path.splitext(fn)[1]](fn)))
+    t2 = time.time()
+    return rows, t2-t1, base, peak_rss()
+
+def bench_chunked(n_rows=30000000, formats=('csv', 'parquet', 'feather'), whole=True):
+    # peak rss and throughput of replaying one large file chunk by chunk, against loading it whole
+    context = multiprocessing.get_context('spawn')
+    for ext in formats:
+        path = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(path, 'AAPL_bars_01_02_2020.' + ext)
+            write_bars(fn, n_rows)
+            size = os.path.getsize(fn)
+            for mode in ('chunked', 'whole') if whole else ('chunked',):
+                with ProcessPoolExecutor(1, mp_context=context) as pool:
+                    try:
+                        rows, seconds, base, peak = pool.submit(replay_directory, path, mode).result()
+                    except BrokenProcessPool:
+                        # loading a multi GB file whole can exhaust memory
+                        print('chunked: %-7s %.2f GB %-7s process killed (out of memory)' % (ext, size/1e9, mode))
+                        continue
+                print('chunked: %-7s %.2f GB %-7s %d rows in %.1fs, %.0f rows/sec, %.0f MB/sec, peak rss %.0f MB (%.0f MB at start)'
+                      % (ext, size/1e9, mode, rows, seconds, rows/seconds, size/seconds/1e6, peak/1e6, base/1e6))
+                check(rows == n_rows, 'chunked: %s %s replayed %d rows of %d' % (ext, mode, rows, n_rows))
+        finally:
+            shutil.rmtree(path)
+
+def bars_client(address, trader, bar_timeframes=()):
+    # lockstep client trading the first timeframe (every row without timeframes),
+    # returns bars traded, bars received per timeframe and bytes received
+    config = {'cycle': 0, 'replay_mode': 'lockstep'}
+    if bar_timeframes:
+        config['timeframes'] = list(bar_timeframes)
+    trade_timeframe = bar_timeframes[0] if bar_timeframes else None
+    received = {}
+    traded = 0
+    with socket.create_connection(address) as sock:
+        set_nodelay(sock)
+        send_frame(sock, CONFIG, config)
+        reader = FrameReader(sock)
+        while True:
+            kind, meta, batch = reader.recv_batch()
+            if kind == END:
+                return traded, received, reader.bytes_received
+            timeframe = meta.get('timeframe')
+            received[timeframe] = received.get(timeframe, 0) + len(batch)
+            if timeframe == trade_timeframe:
+                for j in range(len(batch)):
+                    trader.generate_signal(batch[j:j+1])
+                traded += len(batch)
+            send_frame(sock, ACK, {'seq': meta['seq']})
+
+def bench_aggregate(n_tickers=500, n_files=20, rows_per_file=390, batch_size=4096,
+                    timeframe_sets=((), ('5min',), ('5min', '15min', '1h')), n_files_socket=50):
+    # aggregation throughput on a merged multi ticker stream, then a lockstep backtest
+    # with rows against one with server side bars (bytes sent and client time)
+    for bar_timeframes in timeframe_sets[1:]:
+        streams = [lazy_ticker_stream('T%d' % i, n_files, rows_per_file, i) for i in range(n_tickers)]
+        batches = list(merge_streams(streams, 'timestamp', batch_size))
+        aggregator = BarAggregator(bar_timeframes)
+        t1 = time.time()
+        bars = {}
+        for records in batches:
+            for timeframe, out in aggregator.update(records):
+                bars[timeframe] = bars.get(timeframe, 0) + len(out)
+        for timeframe, out in aggregator.flush():
+            bars[timeframe] = bars.get(timeframe, 0) + len(out)
+        t2 = time.time()
+        rows = sum(len(records) for records in batches)
+        print('aggregate: %d rows of %d tickers into %s in %.3fs, %.0f rows/sec, bars %s'
+              % (rows, n_tickers, ', '.join(bar_timeframes), t2-t1, rows/(t2-t1), bars))
+
+    dataset = synthetic_dataset(n_files_socket, 4, 390)
+    server = ReplayServer(('localhost', 0), MyTCPHandler, dataset)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for bar_timeframes in timeframe_sets:
+        trader = Trader(10000, 'AAPL', 5, 90)
+        t1 = time.time()
+        traded, received, nbytes = bars_client(server.server_address, trader, bar_timeframes)
+        t2 = time.time()
+        print('aggregate socket: %-20s traded %7d bars, received %s, %.2f MB in %.3fs, wealth %.2f'
+              % (', '.join(bar_timeframes) or 'rows', traded, received, nbytes/1e6, t2-t1, trader.get_wealth()))
+    server.shutdown()
+    server.server_close()
+
+benchmarks = {'framing': bench_framing, 'load_test': bench_load_test, 'engine': bench_engine, 'merge': bench_merge, 'chunked': bench_chunked, 'stats': bench_stats, 'checkpoint': bench_checkpoint, 'aggregate': bench_aggregate}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        benchmarks[name]()
@@ -0,0 +1,163 @@
+import numpy as np
+from scipy.special import ndtr
+from BlackScholes import is_call, norm_pdf, euro_price, euro_implied_vol
+from BinomialTree import crr_tree
+
+# Implied vols of American options
+# a tree valuation is the expensive part, so quotes are solved in stages that each start
+#   where the previous one stopped:
+#   1. Barone-Adesi-Whaley, an analytic approximation of the American price
+#   2. Richardson extrapolated coarse trees (2 P(2N) - P(N)) for every N in levels
+#   3. the tree the answer is defined on (N steps, like OptionChain.american_crr_tree)
+# every stage is a bracketed secant solve of all quotes at once, so by the last stage the
+#   starting point is close enough that a couple of N step trees per quote are enough
+
+def baw_critical(S, K, r, q, vol, T, call, iterations=50):
+    # critical spot price above which (calls) or below which (puts) exercising is optimal,
+    # Newton iterations on the Barone-Adesi-Whaley boundary condition (Haug's seed and update)
+    b = r - q
+    w = vol*np.sqrt(T)
+    M = 2*r/(vol*vol)
+    Nb = 2*b/(vol*vol)
+    k = 1 - np.exp(-r*T)
+    root = np.sqrt((Nb - 1)**2 + 4*M/k)
+    root_inf = np.sqrt((Nb - 1)**2 + 4*M)
+    c = np.where(call, 1., -1.)
+    q_exp = .5*(-(Nb - 1) + c*root) # q2 for calls, q1 for puts
+    s_inf = K/(1 - 2/(-(Nb - 1) + c*root_inf))
+    h = np.where(call, -(b*T + 2*w)*K/(s_inf - K), (b*T - 2*w)*K/(K - s_inf))
+    seed = np.where(call, K + (s_inf - K)*(1 - np.exp(h)), s_inf + (K - s_inf)*np.exp(h))
+    Si = np.where(np.isfinite(seed) & (seed > 0), seed, K)
+    carry = np.exp((b - r)*T)
+    for _ in range(iterations):
+        D1 = (np.log(Si/K) + (b + .5*vol*vol)*T)/w
+        lhs = c*(Si - K)
+        rhs = euro_price(Si, K, r, q, vol, T, call) + c*(1 - carry*ndtr(c*D1))*Si/q_exp
+        slope = c*carry*ndtr(c*D1)*(1 - 1/q_exp) + (1 - c*carry*norm_pdf(D1)/w)/q_exp
+        Si = np.where(call, (K + rhs - slope*Si)/(1 - slope), (K - rhs + slope*Si)/(1 + slope))
+        if np.all(np.abs(lhs - rhs) <= 1e-9*K):
+            break
+    return Si, q_exp, carry
+
+def baw_price(S, K, r, q, vol, T, style):
+    '''
+    Barone-Adesi-Whaley approximation of American option prices, arrays broadcast together
+    Calls on stocks without dividends are never exercised early and get the European price
+    '''
+    call = is_call(style)
+    S, K, r, q, vol, T, call = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (S, K, r, q, vol, T)], call)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        euro = euro_price(S, K, r, q, vol, T, call)
+        Si, q_exp, carry = baw_critical(S, K, r, q, vol, T, call)
+        c = np.where(call, 1., -1.)
+        D1 = (np.log(Si/K) + (r - q + .5*vol*vol)*T)/(vol*np.sqrt(T))
+        A = c*(Si/q_exp)*(1 - carry*ndtr(c*D1))
+        early = c*(S - Si) < 0 # spot has not crossed the boundary
+        price = np.where(early, euro + A*(S/Si)**q_exp, c*(S - K))
+        price = np.where(call & (q <= 0), euro, price)
+    return np.where(np.isfinite(price), np.maximum(price, euro), euro)
+
+def bracketed_solve(price_fn, target, vol, lo, hi, vtol, maxiter=100):
+    '''
+    Vols where price_fn(rows, vol) equals target, for every quote at once
+    Secant steps (the first one uses the Black-Scholes vega of the quote) kept inside
+        the bracket [lo, hi] of the root, which every evaluation narrows, and replaced
+        by bisection when they would leave it
+    Returns the vols, NaN where the bracket closed on no root or maxiter was reached
+    '''
+    n = len(target)
+    result = np.full(n, np.nan)
+    lo, hi, vol = lo.copy(), hi.copy(), vol.copy()
+    prev_vol = np.full(n, np.nan)
+    prev_diff = np.full(n, np.nan)
+    active = np.arange(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(maxiter):
+            if len(active) == 0:
+                break
+            v = vol[active]
+            diff = price_fn(active, v) - target[active]
+            above = diff > 0
+            hi[active] = np.where(above, np.minimum(hi[active], v), hi[active])
+            lo[active] = np.where(above, lo[active], np.maximum(lo[active], v))
+
+            slope = (diff - prev_diff[active])/(v - prev_vol[active])
+            first = ~(np.isfinite(slope) & (slope > 0))
+            if first.any():
+                rows = active[first]
+                slope[first] = price_fn.vega(rows, v[first])
+            new = v - diff/slope
+            l, h = lo[active], hi[active]
+            inside = np.isfinite(new) & (new > l) & (new < h)
+            new = np.where(inside, new, .5*(l + h))
+
+            done = (np.abs(new - v) <= vtol) | (diff == 0)
+            failed = (h - l <= vtol) & ~done
+            result[active[done]] = np.where(diff[done] == 0, v[done], new[done])
+            prev_vol[active], prev_diff[active] = v, diff
+            vol[active] = new
+            active = active[~done & ~failed]
+    return result
+
+class VolPricer:
+    # price_fn of bracketed_solve for one stage, vega is the Black-Scholes one of the quote
+    def __init__(self, price, S, K, r, q, T, call):
+        self.price, self.S, self.K, self.r, self.q, self.T, self.call = price, S, K, r, q, T, call
+
+    def vega(self, rows, vol):
+        S, K, r, q, T = self.S[rows], self.K[rows], self.r[rows], self.q[rows], self.T[rows]
+        w = vol*np.sqrt(T)
+        D1 = (np.log(S/K) + (r - q)*T)/w + .5*w
+        return np.maximum(S*np.exp(-q*T)*norm_pdf(D1)*np.sqrt(T), 1e-8*S)
+
+    def __call__(self, rows, vol):
+        return self.price(self.S[rows], self.K[rows], self.r[rows], self.q[rows], vol, self.T[rows], self.call[rows])
+
+def richardson_tree(N):
+    # Richardson extrapolation of the CRR price assuming an error in 1/N
+    def price(S, K, r, q, vol, T, call):
+        return 2*crr_tree(S, K, r, q, vol, T, call, 2*N) - crr_tree(S, K, r, q, vol, T, call, N)
+    return price
+
+def american_implied_vol(price, S, K, r, q, T, style, N=1000, levels=(50, 200), tol=1e-8, max_vol=10.):
+    '''
+    Implied vols of American options on the N step CRR tree, all quotes are solved at once
+    price - option prices, S - spot, K - strikes, r, q - rates as decimals, T - years to expiry
+    levels - tree sizes of the coarse stages (see the top of the module), () goes straight to N
+    tol - accuracy of the vols, max_vol - highest vol searched
+    Returns an array shaped like the broadcast inputs (a float for scalar inputs), NaN where the
+        price is outside the no arbitrage bounds (at or below exercise value, above the spot for
+        calls or the strike for puts), T <= 0, or the solver did not converge
+    '''
+    args = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (price, S, K, r, q, T)], is_call(style))
+    shape = args[0].shape
+    price, S, K, r, q, T, call = [a.ravel() for a in args]
+    vol = np.full(len(price), np.nan)
+    with np.errstate(invalid='ignore'):
+        exercise = np.where(call, S - K, K - S)
+        # a price at its exercise value fits every vol up to some level, there is no single answer
+        ok = (np.isfinite(price) & (T > 0) & (S > 0) & (K > 0) & (price - np.maximum(exercise, 0) > 1e-10*K)
+              & (price < np.where(call, S, K)))
+    idx = np.flatnonzero(ok)
+    if len(idx) == 0:
+        vol = vol.reshape(shape)
+        return vol if shape else float(vol)
+    quote = [a[idx] for a in (price, S, K, r, q, T, call)]
+    target, data = quote[0], quote[1:]
+    lo = np.full(len(idx), 1e-4)
+    hi = np.full(len(idx), max_vol)
+
+    # European vol of the American price (an upper bound for puts), then the BAW vol
+    seed = euro_implied_vol(target, *data)
+    seed = np.where(np.isfinite(seed), np.clip(seed, 2e-4, .5*max_vol), .3)
+    seed = bracketed_solve(VolPricer(baw_price, *data), target, seed, lo, hi, 1e-6)
+    for level in levels:
+        seed = np.where(np.isfinite(seed), seed, .3)
+        seed = bracketed_solve(VolPricer(richardson_tree(level), *data), target, seed, lo, hi, 1e-6)
+
+    # the answer on the N step tree, from a seed that is usually within 1e-3 of it
+    seed = np.where(np.isfinite(seed), seed, .3)
+    tree = VolPricer(lambda S, K, r, q, vol, T, call: crr_tree(S, K, r, q, vol, T, call, N), *data)
+    vol[idx] = bracketed_solve(tree, target, seed, lo, hi, tol)
+    vol = vol.reshape(shape)
+    return vol if shape else float(vol)
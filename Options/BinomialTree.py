@@ -0,0 +1,196 @@
+import numpy as np
+from BlackScholes import is_call
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Cox-Ross-Rubinstein binomial trees for American options, many contracts at once
+# the numpy engine keeps one row per contract in a (contracts, N+1) block and steps every row
+#   back through the tree together, node prices are moved one step back in place by multiplying
+#   by d (S u^j d^(i-j) = S u^(j+1) d^(i-j) * d) instead of recomputing powers of u and d
+# the numba engine (used when numba is installed and use_numba is True) runs the same recursion
+#   compiled, one contract per thread
+# greeks come from an extended tree (N+2 steps rooted two steps before today, so the three nodes
+#   of step 2 are today at S d^2, S and S u^2): price, delta, gamma and theta are read off one tree,
+#   vega, volga and vanna share the two bumped vol trees
+# dividends are a continuous yield, like everywhere else in Options
+
+use_numba = numba is not None
+block_size = 32 # contracts per block of the numpy engine, a block takes 2*block_size*(N+1) floats
+
+american_greek_fields = ['price', 'delta', 'gamma', 'theta', 'vega', 'volga', 'vanna']
+
+def tree_params(r, q, vol, T, N):
+    # up factor, risk neutral up probability and one step discount factor of every contract
+    dt = T/N
+    u = np.exp(vol*np.sqrt(dt))
+    d = 1/u
+    p = (np.exp((r - q)*dt) - d)/(u - d)
+    return u, p, np.exp(-r*dt)
+
+def crr_block(S, K, u, p, disc, call, N, stop=0):
+    # backward induction of a block of contracts from step N to step stop, every argument is a column
+    # (contracts, 1), returns the values of the nodes of step stop and of the middle node of step stop+2
+    c = np.where(call, 1., -1.)
+    prices = S*u**(2.*np.arange(N + 1) - N) # node j of the last step is S u^j d^(N-j)
+    values = np.maximum(c*(prices - K), 0)
+    out = np.empty((len(values), stop + 2))
+    out[:, -1] = values[:, min(stop//2 + 1, N)]
+    d = 1/u
+    up = disc*p
+    down = disc*(1 - p)
+    scratch = np.empty_like(values)
+    for i in range(N - 1, stop - 1, -1):
+        # values[:, j] = disc*(p*values[:, j+1] + (1-p)*values[:, j]) for j <= i, in place
+        head = values[:, :i+1]
+        upper = np.multiply(values[:, 1:i+2], up, out=scratch[:, :i+1])
+        head *= down
+        head += upper
+        prices = prices[:, 1:i+2]
+        prices *= d
+        np.maximum(head, c*(prices - K), out=head)
+        if i == stop + 2:
+            out[:, -1] = values[:, stop//2 + 1]
+    out[:, :stop+1] = values[:, :stop+1]
+    return out
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def crr_kernel(S, K, u, p, disc, call, N, stop):
+        out = np.empty((len(S), stop + 2))
+        for m in numba.prange(len(S)):
+            c = 1. if call[m] else -1.
+            values = np.empty(N + 1)
+            prices = np.empty(N + 1)
+            node = S[m]*u[m]**(-N)
+            up2 = u[m]*u[m]
+            for j in range(N + 1):
+                prices[j] = node
+                values[j] = max(c*(node - K[m]), 0.)
+                node *= up2
+            out[m, stop + 1] = values[min(stop//2 + 1, N)]
+            d = 1/u[m]
+            a = disc[m]*p[m]
+            b = disc[m]*(1 - p[m])
+            for i in range(N - 1, stop - 1, -1):
+                for j in range(i + 1):
+                    prices[j] = prices[j + 1]*d
+                    values[j] = max(b*values[j] + a*values[j + 1], c*(prices[j] - K[m]))
+                if i == stop + 2:
+                    out[m, stop + 1] = values[stop//2 + 1]
+            for j in range(stop + 1):
+                out[m, j] = values[j]
+        return out
+
+def run_tree(S, K, u, p, disc, call, N, stop=0):
+    # flat arrays of contracts through the numba or the numpy engine, see crr_block for the output
+    if use_numba and numba is not None:
+        return crr_kernel(S, K, u, p, disc, call, N, stop)
+    out = np.empty((len(S), stop + 2))
+    for start in range(0, len(S), block_size):
+        rows = slice(start, start + block_size)
+        out[rows] = crr_block(*[a[rows, None] for a in (S, K, u, p, disc, call)], N, stop)
+    return out
+
+def flat_args(S, K, r, q, vol, T, style):
+    args = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (S, K, r, q, vol, T)], is_call(style))
+    return args[0].shape, [a.ravel() for a in args]
+
+def crr_tree(S, K, r, q, vol, T, style, N=1000):
+    '''
+    Prices of American options on a CRR tree with N steps
+    S, K, r, q, vol, T and style (see BlackScholes.is_call) broadcast together,
+        returns an array of prices shaped like them (a float for scalar inputs)
+    '''
+    shape, (S, K, r, q, vol, T, call) = flat_args(S, K, r, q, vol, T, style)
+    u, p, disc = tree_params(r, q, vol, T, N)
+    out = run_tree(S, K, u, p, disc, call, N)[:, 0].reshape(shape)
+    return out if shape else float(out)
+
+def crr_extended(S, K, r, q, vol, T, call, N=1000):
+    # price, delta, gamma and theta (per year) of flat arrays of contracts from one extended tree each,
+    # as a (contracts, 4) array
+    u, p, disc = tree_params(r, q, vol, T, N)
+    down, mid, up, later = run_tree(S, K, u, p, disc, call, N + 2, stop=2).T
+    high = S*u*u
+    low = S/(u*u)
+    out = np.empty((len(S), 4))
+    out[:, 0] = mid
+    out[:, 1] = (up - down)/(high - low)
+    out[:, 2] = ((up - mid)/(high - S) - (mid - down)/(S - low))/(.5*(high - low))
+    out[:, 3] = (later - mid)/(2*T/N)
+    return out
+
+class TreeCache:
+    '''
+    Extended tree valuations (crr_extended) keyed by (S, K, r, q, vol, T, call, N)
+    Keeps a chain computation from valuing the same tree twice, whichever greeks ask for it
+    Holds at most max_size trees, it is emptied when a batch would take it past that
+    '''
+
+    def __init__(self, max_size=100000):
+        self.values = {}
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, S, K, r, q, vol, T, call, N):
+        # flat arrays of contracts, only the ones not seen before are valued (in one batch)
+        # contracts with a non finite input (NaN vols) are valued every time and never kept,
+        # NaN != NaN so their keys would never be found again
+        finite = np.isfinite(S) & np.isfinite(K) & np.isfinite(r) & np.isfinite(q) & np.isfinite(vol) & np.isfinite(T)
+        if not finite.all():
+            out = np.empty((len(S), 4))
+            out[finite] = self.evaluate(S[finite], K[finite], r[finite], q[finite], vol[finite], T[finite], call[finite], N)
+            rest = ~finite
+            out[rest] = crr_extended(S[rest], K[rest], r[rest], q[rest], vol[rest], T[rest], call[rest], N)
+            return out
+        keys = [key + (N,) for key in zip(S.tolist(), K.tolist(), r.tolist(), q.tolist(), vol.tolist(), T.tolist(), call.tolist())]
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in self.values and key not in missing:
+                missing[key] = i
+        if missing:
+            rows = np.fromiter(missing.values(), dtype=np.int64, count=len(missing))
+            values = crr_extended(S[rows], K[rows], r[rows], q[rows], vol[rows], T[rows], call[rows], N)
+            if len(self.values) + len(missing) > self.max_size:
+                # the batch's other keys are looked up below, so they are kept along with it
+                self.values = {key: self.values[key] for key in keys if key in self.values}
+            self.values.update(zip(missing, values))
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        return np.array([self.values[key] for key in keys]).reshape(len(keys), 4)
+
+    def clear(self):
+        self.values = {}
+
+def crr_greeks(S, K, r, q, vol, T, style, N=1000, dvol=.001, cache=None):
+    '''
+    Price and greeks of American options, 3 extended trees per contract
+    price, delta, gamma and theta come from the tree at vol, vega, volga and vanna
+        from the same tree and the trees at vol*(1 +- dvol)
+    cache - TreeCache shared by the calls of one chain computation, None values every tree
+    Returns a structured array (fields in american_greek_fields) shaped like the broadcast inputs
+    '''
+    shape, (S, K, r, q, vol, T, call) = flat_args(S, K, r, q, vol, T, style)
+    n = len(S)
+    args = [np.tile(a, 3) for a in (S, K, r, q)] + [np.concatenate((vol, vol*(1 + dvol), vol*(1 - dvol)))] \
+        + [np.tile(a, 3) for a in (T, call)]
+    if cache is None:
+        values = crr_extended(*args, N)
+    else:
+        values = cache.evaluate(*args, N)
+    base, plus, minus = values[:n], values[n:2*n], values[2*n:]
+    h = dvol*vol
+
+    out = np.empty(n, dtype=[(name, float) for name in american_greek_fields])
+    out['price'] = base[:, 0]
+    out['delta'] = base[:, 1]
+    out['gamma'] = base[:, 2]
+    out['theta'] = base[:, 3]
+    out['vega'] = (plus[:, 0] - minus[:, 0])/(2*h)
+    out['volga'] = (plus[:, 0] - 2*base[:, 0] + minus[:, 0])/(h*h)
+    out['vanna'] = (plus[:, 1] - minus[:, 1])/(2*h)
+    return out.reshape(shape)
@@ -0,0 +1,137 @@
+import numpy as np
+from scipy.special import ndtr
+
+# Vectorized Black-Scholes-Merton formulas for European options
+# every function takes scalars or numpy arrays that broadcast together
+# style is 'C' or 'P', an array of them, or a boolean array (True for calls)
+
+sqrt_2pi = np.sqrt(2*np.pi)
+
+def norm_pdf(x):
+    return np.exp(-.5*x*x)/sqrt_2pi
+
+def is_call(style):
+    style = np.asarray(style)
+    if style.dtype == bool:
+        return style
+    return (style == 'C') | (style == 'c')
+
+def euro_price(S, K, r, q, vol, T, style):
+    # discounted price of European calls and puts
+    c = np.where(is_call(style), 1., -1.)
+    w = vol*np.sqrt(T)
+    D1 = (np.log(S/K) + (r - q)*T)/w + .5*w
+    return c*(S*np.exp(-q*T)*ndtr(c*D1) - K*np.exp(-r*T)*ndtr(c*(D1 - w)))
+
+greek_fields = ['price', 'delta', 'gamma', 'vega', 'theta', 'rho', 'vanna', 'volga', 'charm']
+
+def euro_greeks(S, K, r, q, vol, T, style):
+    '''
+    Price and first and second order greeks of European options in one pass,
+        d1, d2, the discount factors, pdf and cdf are computed once for every contract
+    Returns a structured array (fields in greek_fields) shaped like the broadcast inputs
+    Same units as the functions in Greeks: vega, vanna and volga per unit of vol,
+        theta and charm per year, rho per unit of rate
+    '''
+    c = np.where(is_call(style), 1., -1.)
+    sqrt_T = np.sqrt(T)
+    w = vol*sqrt_T
+    D1 = (np.log(S/K) + (r - q)*T)/w + .5*w
+    D2 = D1 - w
+    Sq = S*np.exp(-q*T)
+    Kr = K*np.exp(-r*T)
+    pdf = norm_pdf(D1)
+    cdf1 = ndtr(c*D1)
+    cdf2 = ndtr(c*D2)
+    delta_q = np.exp(-q*T)*pdf # shared by gamma, vanna and charm
+    vega = Sq*pdf*sqrt_T
+
+    out = np.empty(np.broadcast(S, K, r, q, vol, T, c).shape, dtype=[(name, float) for name in greek_fields])
+    out['price'] = c*(Sq*cdf1 - Kr*cdf2)
+    out['delta'] = c*np.exp(-q*T)*cdf1
+    out['gamma'] = delta_q/(S*w)
+    out['vega'] = vega
+    out['theta'] = -.5*Sq*pdf*vol/sqrt_T - c*(r*Kr*cdf2 - q*Sq*cdf1)
+    out['rho'] = c*T*Kr*cdf2
+    out['vanna'] = -delta_q*D2/vol
+    out['volga'] = vega*D1*D2/vol
+    out['charm'] = c*q*np.exp(-q*T)*cdf1 - delta_q*(2*(r - q)*T - D2*w)/(2*T*w)
+    return out
+
+def corrado_miller(call, F, K):
+    # closed form approximation of the total vol (vol*sqrt(T)) of an undiscounted call price,
+    # falls back to the at the money approximation when the square root is undefined
+    a = call - .5*(F - K)
+    w = sqrt_2pi/(F + K)*(a + np.sqrt(np.maximum(a*a - (F - K)**2/np.pi, 0)))
+    return np.where(w > 0, w, sqrt_2pi*call/F)
+
+def euro_implied_vol(price, S, K, r, q, T, style, tol=1e-12, maxiter=100):
+    '''
+    Implied vols of European options, all quotes are solved at once
+    price - option prices, S - spot, K - strikes, r, q - rates as decimals, T - years to expiry
+    Returns an array of vols shaped like the broadcast inputs (a float for scalar inputs),
+        NaN where there is no solution (price outside the no arbitrage bounds, T <= 0, ...)
+        or the solver did not converge
+    The out of the money side of each quote is solved (in the money prices go through
+        put call parity), starting from the Corrado-Miller approximation and iterating
+        Halley steps on the total vol w = vol*sqrt(T), every step is kept inside a bracket
+        of the root and replaced by bisection when it would leave it
+    '''
+    args = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (price, S, K, r, q, T)], is_call(style))
+    shape = args[0].shape
+    price, S, K, r, q, T, call = [a.ravel() for a in args]
+
+    df = np.exp(-r*T)
+    F = S*np.exp((r - q)*T)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        target = price/df # undiscounted
+        otm_call = K >= F
+        intrinsic = np.maximum(np.where(call, F - K, K - F), 0)
+        target = np.where(call == otm_call, target, target - intrinsic)
+        upper = np.where(otm_call, F, K)
+        ok = (np.isfinite(target) & np.isfinite(F) & (T > 0) & (S > 0) & (K > 0)
+              & (target > 0) & (target < upper))
+
+    vol = np.full(len(price), np.nan)
+    idx = np.flatnonzero(ok)
+    target, F, K, otm_call = target[idx], F[idx], K[idx], otm_call[idx]
+    x = np.log(F/K)
+    sign = np.where(otm_call, 1., -1.)
+    w = corrado_miller(np.where(otm_call, target, target + F - K), F, K)
+    w = np.where(np.isfinite(w) & (w > 0), w, 1.)
+    lo = np.zeros(len(idx))
+    hi = np.full(len(idx), np.inf)
+    result = np.full(len(idx), np.nan)
+    active = np.arange(len(idx))
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for _ in range(maxiter):
+            if len(active) == 0:
+                break
+            s, f, k, t = sign[active], F[active], K[active], target[active]
+            D1 = x[active]/w + .5*w
+            D2 = D1 - w
+            diff = s*(f*ndtr(s*D1) - k*ndtr(s*D2)) - t
+            vega = f*norm_pdf(D1)
+
+            # the price grows with w, so the sign of diff moves one side of the bracket
+            above = diff > 0
+            hi[active] = np.where(above, np.minimum(hi[active], w), hi[active])
+            lo[active] = np.where(above, lo[active], np.maximum(lo[active], w))
+
+            newton = -diff/vega
+            denom = 1 + .5*newton*D1*D2/w
+            step = np.where(denom > .5, newton/denom, newton)
+            new = w + step
+            l, h = lo[active], hi[active]
+            inside = np.isfinite(new) & (new > l) & (new < h)
+            new = np.where(inside, new, np.where(np.isfinite(h), .5*(l + h), 2*np.maximum(w, 1.)))
+
+            done = (np.abs(diff) <= tol*t) | (np.abs(new - w) <= tol*w)
+            result[active[done]] = np.where(inside[done], new[done], w[done])
+            w = new[~done]
+            active = active[~done]
+
+    vol[idx] = result/np.sqrt(T[idx])
+    vol = vol.reshape(shape)
+    return vol if shape else float(vol)
@@ -0,0 +1,113 @@
+import numpy as np
+
+# Contract master of OCC option symbols (root, expiry yymmdd, C or P, strike*1000 on 8 digits,
+#   like AAPL240419C00100000, the padded OSI form 'AAPL  240419C00100000' is accepted too)
+# whole arrays of symbols are parsed at once: the code points of the symbols are a (symbols, width)
+#   matrix, the last 15 characters of every symbol (expiry, type and strike digits) are gathered
+#   by its length and the characters before them are the root, no regex or strptime per symbol
+# strikes are integer ticks of 1/1000 dollar, as in the symbol
+
+contract_fields = [('root', 'U6'), ('expiry', 'datetime64[D]'), ('type', 'U1'), ('strike', np.int64)]
+strike_tick = .001
+
+def parse_symbols(symbols):
+    '''
+    Parses an array (or list) of OCC symbols
+    Returns a structured array (contract_fields) with one row per symbol,
+        raises ValueError naming the first symbol that is not an OCC symbol
+    '''
+    text = np.ascontiguousarray(np.asarray(symbols, dtype=str).ravel())
+    out = np.empty(len(text), dtype=contract_fields)
+    if len(text) == 0:
+        return out
+    width = max(text.dtype.itemsize//4, 16)
+    text = text.astype('U%d' % width)
+    chars = text.view(np.uint32).reshape(len(text), width)
+    length = np.char.str_len(text)
+    start = length[:, None] - 15
+    tail = np.take_along_axis(chars, np.maximum(start + np.arange(15), 0), axis=1)
+
+    digits = tail.astype(np.int64) - ord('0')
+    kind = tail[:, 6]
+    date, strike = digits[:, :6], digits[:, 7:]
+    valid = ((date >= 0) & (date <= 9)).all(axis=1) & ((strike >= 0) & (strike <= 9)).all(axis=1) \
+        & np.isin(kind, [ord(c) for c in 'CPcp']) & (length >= 16)
+    if not valid.all():
+        raise ValueError('not an OCC option symbol: %r' % str(text[np.argmin(valid)]))
+
+    year = 10*date[:, 0] + date[:, 1]
+    month = 10*date[:, 2] + date[:, 3]
+    day = 10*date[:, 4] + date[:, 5]
+    months = (year + 30).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1) # years from 1970
+    expiry = months.astype('datetime64[D]') + (day - 1)
+    # a day past the end of its month rolls into the next one
+    valid = (month >= 1) & (month <= 12) & (day >= 1) & (expiry.astype('datetime64[M]') == months)
+    if not valid.all():
+        raise ValueError('not an OCC option symbol, bad expiry: %r' % str(text[np.argmin(valid)]))
+    # roots (padded with spaces in the OSI form) are the few distinct prefixes of the symbols
+    prefix = np.where(np.arange(width) < start, chars, 0)
+    roots, inverse = np.unique(prefix.view('U%d' % width).ravel(), return_inverse=True)
+    roots = np.char.strip(roots)
+
+    out['root'] = roots[inverse.ravel()]
+    out['expiry'] = expiry
+    out['type'] = np.where((kind == ord('C')) | (kind == ord('c')), 'C', 'P')
+    out['strike'] = strike @ 10**np.arange(7, -1, -1)
+    return out
+
+class ContractMaster:
+    '''
+    Table of option contracts, every OCC symbol is interned to an id (its row in table)
+    Also keeps a hash index of (root, expiry, strike) to the call and the put with them,
+        the paired contract of every row is in the pair column (-1 while there is none)
+    '''
+
+    def __init__(self, capacity=1024):
+        self.ids = {} # symbol -> id
+        self.symbols = [] # id -> symbol
+        self.table = np.zeros(capacity, dtype=contract_fields + [('pair', np.int64)])
+        self.pairs = {} # (root, expiry, strike) -> [call id, put id]
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def intern(self, symbols):
+        # ids of the symbols, the ones not seen before are parsed (in one batch) and added
+        new = list(dict.fromkeys(symbol for symbol in symbols if symbol not in self.ids))
+        if new:
+            parsed = parse_symbols(new)
+            start = len(self.symbols)
+            if start + len(new) > len(self.table):
+                capacity = max(len(self.table), 1)
+                while capacity < start + len(new):
+                    capacity *= 2
+                table = np.zeros(capacity, dtype=self.table.dtype)
+                table[:start] = self.table[:start]
+                self.table = table
+            rows = self.table[start:start + len(new)]
+            for name, _ in contract_fields:
+                rows[name] = parsed[name]
+            rows['pair'] = -1
+            keys = zip(parsed['root'].tolist(), parsed['expiry'].astype(np.int64).tolist(), parsed['strike'].tolist())
+            for i, (symbol, key, kind) in enumerate(zip(new, keys, parsed['type'].tolist())):
+                id = start + i
+                self.ids[symbol] = id
+                self.symbols.append(symbol)
+                pair = self.pairs.setdefault(key, [-1, -1])
+                pair[kind == 'P'] = id
+                if pair[0] >= 0 and pair[1] >= 0:
+                    self.table['pair'][pair[0]] = pair[1]
+                    self.table['pair'][pair[1]] = pair[0]
+        return np.array([self.ids[symbol] for symbol in symbols], dtype=np.int64)
+
+    def contracts(self, ids):
+        # rows of the table
+        return self.table[np.asarray(ids, dtype=np.int64)]
+
+    def strikes(self, ids):
+        # strikes in dollars
+        return self.table['strike'][np.asarray(ids, dtype=np.int64)]*strike_tick
+
+    def pair(self, ids):
+        # ids of the put of each call and the call of each put, -1 where it is not in the master
+        return self.table['pair'][np.asarray(ids, dtype=np.int64)]
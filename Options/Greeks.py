@@ -1,100 +1,120 @@
-import numpy as np
-from scipy.stats import norm
-from QuantLib import *
-
-def d1(S, K, r, q, vol, T):
-        return (np.log(S/K)+(r-q+.5*vol**2)*T)/(vol*np.sqrt(T))
-
-def d2(S, K, r, q, vol, T, D1 = None):
-    if D1:
-        return D1 - vol*np.sqrt(T)
-    else:
-        return d1(S, K, r, q, vol, T) - vol*np.sqrt(T)
-    
-def ec_price(S, K, r, q, vol, T):
-    D1 = d1(S, K, r, q, vol, T)
-    D2 = d2(S, K, r, q, vol, T, D1)
-    return S*np.exp(-q*T)*norm.cdf(D1) - K*np.exp(-r*T)*norm.cdf(D2)
-
-def ep_price(S, K, r, q, vol, T):
-    D1 = d1(S, K, r, q, vol, T)
-    D2 = d2(S, K, r, q, vol, T, D1)
-    return -S*np.exp(-q*T)*norm.cdf(-D1) + K*np.exp(-r*T)*norm.cdf(-D2)
-
-def ec_delta(S, K, r, q, vol, T):
-    # euro call delta
-    D1 = d1(S, K, r, q, vol, T)
-    return np.exp(-q*T)*norm.cdf(D1)
-
-def ep_delta(S, K, r, q, vol, T):
-    # euro put delta
-    D1 = d1(S, K, r, q, vol, T)
-    return -np.exp(-q*T)*norm.cdf(-D1)
-
-def euro_gamma(S, K, r, q, vol, T):
-    # euro gamma
-    D1 = d1(S, K, r, q, vol, T)
-    return np.exp(-q*T)*norm.pdf(D1)/(S*vol*np.sqrt(T))
-
-def euro_vega(S, K, r, q, vol, T):
-    # euro vega
-    D1 = d1(S, K, r, q, vol, T)
-    return S*np.exp(-q*T)*norm.pdf(D1)*np.sqrt(T)
-
-def euro_volga(S, K, r, q, vol, T):
-    # euro volga
-    D1 = d1(S, K, r, q, vol, T)
-    D2 = d2(S, K, r, q, vol, T, D1)
-    return S*np.exp(-q*T)*np.sqrt(T)*norm.pdf(D1)*D1*D2/vol
-
-def euro_vanna(S, K, r, q, vol, T):
-    # euro vanna
-    D1 = d1(S, K, r, q, vol, T)
-    D2 = d2(S, K, r, q, vol, T, D1)
-    return -np.exp(-q*T)*norm.pdf(D1)*D2/vol
-
-def euro_theta(S, K, r, q, vol, T, type):
-    # euro theta
-    D1 = d1(S, K, r, q, vol, T)
-    D2 = d2(S, K, r, q, vol, T, D1)
-
-    c = 1 if type == 'C' else -1
-    one = S*vol*np.exp(-q*T)*norm.pdf(D1)/(2*np.sqrt(T))
-    two = r*K*np.exp(-r*T)*norm.cdf(c*D2)
-    three = q*S*np.exp(-q*T)*norm.cdf(c*D1)
-
-    return -one - c*(two - three)
-
-def implied_vol(V, S, K, r, q, expiration, type):
-    # implied vol assuming euro payoff
-    if type == 'C':
-        po = Option.Call
-    else:
-        po = Option.Put
-    exercise = EuropeanExercise(Date(expiration.day,expiration.month,expiration.year))
-    payoff = PlainVanillaPayoff(po, K)
-    option = EuropeanOption(payoff,exercise)
-
-    S = QuoteHandle(SimpleQuote(S))
-    r = YieldTermStructureHandle(FlatForward(0, TARGET(), r, Actual360()))
-    q = YieldTermStructureHandle(FlatForward(0, TARGET(), q, Actual360()))
-    sigma = BlackVolTermStructureHandle(BlackConstantVol(0, TARGET(), 0.20, Actual360()))
-    process = BlackScholesMertonProcess(S,q,r,sigma)
-    
-    return option.impliedVolatility(V, process, 1.0e-4, 1000, 1e-7, 10)
-
-def get_greeks(V, S, K, r, q, T, expiration, type, as_array=True):
-    # calculates all of the greeks above and returns them as an array or dict
-    imp_vol = implied_vol(V, S, K, r, q, expiration, type)
-    delta = ec_delta(S, K, r, q, imp_vol, T) if type == 'C' else ep_delta(S, K, r, q, imp_vol, T)
-    gamma = euro_gamma(S, K, r, q, imp_vol, T)
-    vega = euro_vega(S, K, r, q, imp_vol, T)
-    volga = euro_volga(S, K, r, q, imp_vol, T)
-    vanna = euro_vanna(S, K, r, q, imp_vol, T)
-    theta = euro_theta(S, K, r, q, imp_vol, T, type)
-
-    if as_array:
-        return np.array([imp_vol, delta, gamma, vega, volga, vanna, theta])
-    else:
-        output = {'IV': imp_vol, 'delta': delta, 'gamma': gamma, 'vega': vega, 'volga': volga, 'vanna': vanna, 'theta': theta}
-        return output
+import numpy as np
+from scipy.special import ndtr
+from BlackScholes import norm_pdf, euro_greeks, euro_implied_vol
+
+# implied vols are solved with the vectorized solver of BlackScholes, for whole arrays of contracts
+# QuantLib is only imported the first time its solver is asked for (backend='quantlib'),
+#   importing this module does not need it
+ql = None
+
+def quantlib():
+    # imports QuantLib on first use
+    global ql
+    if ql is None:
+        import QuantLib
+        ql = QuantLib
+    return ql
+
+def d1(S, K, r, q, vol, T):
+        return (np.log(S/K)+(r-q+.5*vol**2)*T)/(vol*np.sqrt(T))
+
+def d2(S, K, r, q, vol, T, D1 = None):
+    if D1:
+        return D1 - vol*np.sqrt(T)
+    else:
+        return d1(S, K, r, q, vol, T) - vol*np.sqrt(T)
+    
+def ec_price(S, K, r, q, vol, T):
+    D1 = d1(S, K, r, q, vol, T)
+    D2 = d2(S, K, r, q, vol, T, D1)
+    return S*np.exp(-q*T)*ndtr(D1) - K*np.exp(-r*T)*ndtr(D2)
+
+def ep_price(S, K, r, q, vol, T):
+    D1 = d1(S, K, r, q, vol, T)
+    D2 = d2(S, K, r, q, vol, T, D1)
+    return -S*np.exp(-q*T)*ndtr(-D1) + K*np.exp(-r*T)*ndtr(-D2)
+
+def ec_delta(S, K, r, q, vol, T):
+    # euro call delta
+    D1 = d1(S, K, r, q, vol, T)
+    return np.exp(-q*T)*ndtr(D1)
+
+def ep_delta(S, K, r, q, vol, T):
+    # euro put delta
+    D1 = d1(S, K, r, q, vol, T)
+    return -np.exp(-q*T)*ndtr(-D1)
+
+def euro_gamma(S, K, r, q, vol, T):
+    # euro gamma
+    D1 = d1(S, K, r, q, vol, T)
+    return np.exp(-q*T)*norm_pdf(D1)/(S*vol*np.sqrt(T))
+
+def euro_vega(S, K, r, q, vol, T):
+    # euro vega
+    D1 = d1(S, K, r, q, vol, T)
+    return S*np.exp(-q*T)*norm_pdf(D1)*np.sqrt(T)
+
+def euro_volga(S, K, r, q, vol, T):
+    # euro volga
+    D1 = d1(S, K, r, q, vol, T)
+    D2 = d2(S, K, r, q, vol, T, D1)
+    return S*np.exp(-q*T)*np.sqrt(T)*norm_pdf(D1)*D1*D2/vol
+
+def euro_vanna(S, K, r, q, vol, T):
+    # euro vanna
+    D1 = d1(S, K, r, q, vol, T)
+    D2 = d2(S, K, r, q, vol, T, D1)
+    return -np.exp(-q*T)*norm_pdf(D1)*D2/vol
+
+def euro_theta(S, K, r, q, vol, T, type):
+    # euro theta
+    D1 = d1(S, K, r, q, vol, T)
+    D2 = d2(S, K, r, q, vol, T, D1)
+
+    c = 1 if type == 'C' else -1
+    one = S*vol*np.exp(-q*T)*norm_pdf(D1)/(2*np.sqrt(T))
+    two = r*K*np.exp(-r*T)*ndtr(c*D2)
+    three = q*S*np.exp(-q*T)*ndtr(c*D1)
+
+    return -one - c*(two - three)
+
+def implied_vol(V, S, K, r, q, expiration, type):
+    # implied vol assuming euro payoff, one contract with QuantLib
+    ql = quantlib()
+    if type == 'C':
+        po = ql.Option.Call
+    else:
+        po = ql.Option.Put
+    exercise = ql.EuropeanExercise(ql.Date(expiration.day,expiration.month,expiration.year))
+    payoff = ql.PlainVanillaPayoff(po, K)
+    option = ql.EuropeanOption(payoff,exercise)
+
+    S = ql.QuoteHandle(ql.SimpleQuote(S))
+    r = ql.YieldTermStructureHandle(ql.FlatForward(0, ql.TARGET(), r, ql.Actual360()))
+    q = ql.YieldTermStructureHandle(ql.FlatForward(0, ql.TARGET(), q, ql.Actual360()))
+    sigma = ql.BlackVolTermStructureHandle(ql.BlackConstantVol(0, ql.TARGET(), 0.20, ql.Actual360()))
+    process = ql.BlackScholesMertonProcess(S,q,r,sigma)
+    
+    return option.impliedVolatility(V, process, 1.0e-4, 1000, 1e-7, 10)
+
+def get_greeks(V, S, K, r, q, T, expiration, type, as_array=True, backend='numpy'):
+    # calculates all of the greeks above and returns them as an array or dict
+    # one pass of the fused kernel (see BlackScholes) instead of a d1/d2 per greek
+    # V, S, K, r, q, T and type can be arrays of contracts, they are then all solved at once and the
+    # array has one row per contract (a dict of arrays otherwise), a contract without a vol gets NaN
+    # backend - 'numpy' solves the vols on T, 'quantlib' solves them one by one on expiration
+    #   (dates, an array of them for arrays of contracts) with QuantLib
+    if backend == 'quantlib':
+        imp_vol = np.vectorize(implied_vol, otypes=[float])(V, S, K, r, q, expiration, type)
+    else:
+        imp_vol = euro_implied_vol(V, S, K, r, q, T, type)
+    greeks = euro_greeks(S, K, r, q, imp_vol, T, type)
+    values = [np.asarray(imp_vol)] + [greeks[name] for name in ('delta', 'gamma', 'vega', 'volga', 'vanna', 'theta')]
+    if greeks.shape == ():
+        values = [float(v) for v in values]
+
+    if as_array:
+        return np.stack(values, axis=-1)
+    else:
+        output = dict(zip(['IV', 'delta', 'gamma', 'vega', 'volga', 'vanna', 'theta'], values))
+        return output
@@ -1,75 +1,181 @@
-import numpy as np
-import pandas as pd
-from datetime import datetime
-import re
-from Greeks import get_greeks
-
-class OptionPortfolio:
-    '''This class stores options and calculates their greeks,
-        keeping track of individual and portfolio greeks.
-        Every time an option is added, all the greeks are updated.
-        If spot, rate, or div yield change, the update_portfolio_greeks
-        method has to be manually called.'''
-    
-    def __init__(self, ticker, spot, rate, div, today):
-        self.ticker = ticker
-        self.s = spot # dollar
-        self.r = rate # decimal
-        self.q = div # decimal
-        self.portfolio = {}
-        self.portfolio_greeks = np.zeros((7,))
-        self.option_greeks = pd.DataFrame()
-        self.today = datetime.strptime(today, '%Y/%m/%d')
-
-    def op_contract_dec(self, contract_string):
-    # parses option contract names
-        option_regex = r"^([A-z]{1,5})(\d{6})([CPcp])([\d.]+)"
-        matches = re.findall(option_regex, contract_string)
-
-        return {'id': contract_string,'ticker':matches[0][0], 'date':datetime.strptime(matches[0][1], '%y%m%d'), 
-                'type':matches[0][2], 'strike':float(matches[0][3])/1000}
-
-    def update_portfolio_greeks(self):
-        # goes through every option in the portfolio and updates the greeks
-        self.portfolio_greeks = np.zeros((7,))
-        option_greeks_list = []
-        options = list(self.portfolio.keys())
-        for opt in options:
-            V = self.portfolio[opt]['price']
-            S = self.s
-            K = self.portfolio[opt]['strike']
-            r = self.r
-            q = self.q
-            T = self.portfolio[opt]['tte']
-            expiration = self.portfolio[opt]['exp']
-            typ = self.portfolio[opt]['type']
-            if self.portfolio[opt]['side'] == 'Buy':
-                greeks = get_greeks(V, S, K, r, q, T, expiration, typ)
-                self.portfolio_greeks += greeks
-                op_greeks = [opt] + list(greeks)
-            else:
-                greeks = get_greeks(V, S, K, r, q, T, expiration, typ)
-                self.portfolio_greeks -= greeks
-                op_greeks = [opt] + list(-1*greeks)
-            option_greeks_list.append(op_greeks)
-        columns = ['Contract','Implied Vol', 'Delta', 'Gamme', 'Vega', 'Volga', 'Vanna', 'Theta']
-        self.option_greeks = pd.DataFrame(option_greeks_list, columns=columns)
-
-    def add_option(self, id, price, side):
-        # adds option to portfolio
-        # must provide the contract name, market price and side ("Buy" or "Sell")
-        profile = self.op_contract_dec(id)
-        tte = (profile['date'] - self.today).days/365
-        self.portfolio[id] = {'price': price, 'strike': profile['strike'], 'tte': tte, 'exp': profile['date'], 
-                              'side': side, 'type': profile['type']}
-        
-        self.update_portfolio_greeks()
-
-    def remove_option(self, id):
-        # removes option from portfolio based on contract name
-        # added for readability and symmetry with add_option method
-        del self.portfolio[id]
-
-        self.update_portfolio_greeks()
-
-        
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from Greeks import get_greeks
+from ContractMaster import ContractMaster, parse_symbols, strike_tick
+from Scenarios import scenario_grid
+
+greek_columns = ['Contract','Implied Vol', 'Delta', 'Gamme', 'Vega', 'Volga', 'Vanna', 'Theta']
+
+class OptionPortfolio:
+    '''This class stores options and calculates their greeks,
+        keeping track of individual and portfolio greeks.
+        Contracts are kept in numpy arrays indexed by slot together with their
+        greeks, so adding or removing options only values the new contracts and
+        moves the portfolio greeks by their contribution.
+        If spot, rate, or div yield change, the revalue method (or
+        update_portfolio_greeks) has to be manually called.'''
+    
+    def __init__(self, ticker, spot, rate, div, today, capacity=64):
+        self.ticker = ticker
+        self.s = spot # dollar
+        self.r = rate # decimal
+        self.q = div # decimal
+        self.portfolio = {}
+        self.portfolio_greeks = np.zeros((7,))
+        self.today = datetime.strptime(today, '%Y/%m/%d')
+
+        self.slots = {} # contract -> slot
+        self.contracts = [] # slot -> contract
+        self.prices = np.zeros(capacity)
+        self.strikes = np.zeros(capacity)
+        self.ttes = np.zeros(capacity)
+        self.calls = np.zeros(capacity, dtype=bool)
+        self.signs = np.zeros(capacity) # 1 bought, -1 sold
+        self.greeks = np.zeros((capacity, 7)) # greeks of every slot, signed like the side
+        self.evaluations = 0 # contracts valued so far
+        self.master = ContractMaster() # parsed contract names
+
+    def op_contract_dec(self, contract_string):
+    # parses option contract names (see ContractMaster)
+        contract = parse_symbols([contract_string])[0]
+        date = contract['expiry'].astype(datetime)
+        return {'id': contract_string,'ticker':str(contract['root']), 'date':datetime(date.year, date.month, date.day), 
+                'type':str(contract['type']), 'strike':float(contract['strike']*strike_tick)}
+
+    @property
+    def option_greeks(self):
+        # greeks of every option, built when asked for
+        df = pd.DataFrame(self.greeks[:len(self.contracts)], columns=greek_columns[1:])
+        df.insert(0, 'Contract', self.contracts)
+        return df
+
+    def grow(self, size):
+        # arrays double in size until size slots fit
+        capacity = max(len(self.prices), 1)
+        while capacity < size:
+            capacity *= 2
+        if capacity == len(self.prices):
+            return
+        for name in ('prices', 'strikes', 'ttes', 'calls', 'signs', 'greeks'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def value(self, slots):
+        # greeks of the given slots in one get_greeks call, signed like the side
+        self.evaluations += len(slots)
+        if len(slots) == 0:
+            return np.zeros((0, 7))
+        greeks = get_greeks(self.prices[slots], self.s, self.strikes[slots], self.r, self.q, self.ttes[slots], None,
+                            self.calls[slots])
+        return self.signs[slots, None]*greeks
+
+    def update_portfolio_greeks(self):
+        # values every option in the portfolio again and sums the greeks
+        slots = np.arange(len(self.contracts))
+        self.greeks[slots] = self.value(slots)
+        self.portfolio_greeks = self.greeks[slots].sum(axis=0)
+
+    def revalue(self, spot=None, rate=None, div=None):
+        # new spot, rate or div yield, every option is valued again in one call
+        self.s = self.s if spot is None else spot
+        self.r = self.r if rate is None else rate
+        self.q = self.q if div is None else div
+        self.update_portfolio_greeks()
+
+    def add_options(self, ids, prices, sides):
+        # adds options to portfolio, only they are valued
+        # must provide the contract names, market prices and sides ("Buy" or "Sell")
+        # a contract already in the portfolio is replaced, the last one wins when one is given twice
+        new = {}
+        for id, price, side in zip(ids, prices, sides):
+            new[id] = (price, side)
+        # every new contract name is parsed in one batch, before anything is replaced, so a bad
+        # name leaves the portfolio unchanged
+        contracts = self.master.contracts(self.master.intern(list(new)))
+        held = [id for id in new if id in self.slots]
+        if held:
+            self.remove_options(held)
+
+        start = len(self.contracts)
+        self.grow(start + len(new))
+        slots = np.arange(start, start + len(new))
+        strikes = contracts['strike']*strike_tick
+        ttes = (contracts['expiry'] - np.datetime64(self.today, 'D')).astype(np.int64)/365
+        expirations = contracts['expiry'].astype('datetime64[us]').tolist()
+        records = zip(slots, new.items(), strikes.tolist(), ttes.tolist(), expirations, contracts['type'].tolist())
+        for slot, (id, (price, side)), strike, tte, exp, type in records:
+            self.portfolio[id] = {'price': price, 'strike': strike, 'tte': tte, 'exp': exp, 
+                                  'side': side, 'type': type}
+            self.slots[id] = slot
+            self.contracts.append(id)
+        self.prices[slots] = [price for price, _ in new.values()]
+        self.strikes[slots] = strikes
+        self.ttes[slots] = ttes
+        self.calls[slots] = contracts['type'] == 'C'
+        self.signs[slots] = [1. if side == 'Buy' else -1. for _, side in new.values()]
+
+        greeks = self.value(slots)
+        self.greeks[slots] = greeks
+        self.portfolio_greeks += greeks.sum(axis=0)
+
+    def remove_options(self, ids):
+        # removes options from portfolio based on contract names
+        # the last slot moves into each freed one so the arrays stay dense
+        # every id is checked first, so a bad list leaves the portfolio unchanged
+        ids = list(ids)
+        missing = [id for id in ids if id not in self.slots]
+        if missing:
+            raise KeyError('not in the portfolio: %s' % ', '.join(map(str, missing)))
+        if len(set(ids)) != len(ids):
+            raise ValueError('ids to remove are repeated')
+        removed = np.zeros((7,))
+        for id in ids:
+            slot = self.slots.pop(id)
+            del self.portfolio[id]
+            removed += self.greeks[slot]
+            last = len(self.contracts) - 1
+            if slot != last:
+                moved = self.contracts[last]
+                self.contracts[slot] = moved
+                self.slots[moved] = slot
+                for array in (self.prices, self.strikes, self.ttes, self.calls, self.signs, self.greeks):
+                    array[slot] = array[last]
+            self.contracts.pop()
+        self.portfolio_greeks -= removed
+        if not np.all(np.isfinite(self.portfolio_greeks)):
+            # a contract without a vol (NaN greeks) left, sum what is still held
+            self.portfolio_greeks = self.greeks[:len(self.contracts)].sum(axis=0)
+
+    def update_prices(self, ids, prices):
+        # new market prices of options already in the portfolio, only they are valued again
+        new = dict(zip(ids, prices))
+        slots = np.array([self.slots[id] for id in new], dtype=np.int64)
+        for id, price in new.items():
+            self.portfolio[id]['price'] = price
+        self.prices[slots] = list(new.values())
+        greeks = self.value(slots)
+        self.portfolio_greeks += greeks.sum(axis=0) - self.greeks[slots].sum(axis=0)
+        self.greeks[slots] = greeks
+        if not np.all(np.isfinite(self.portfolio_greeks)):
+            self.portfolio_greeks = self.greeks[:len(self.contracts)].sum(axis=0)
+
+    def add_option(self, id, price, side):
+        # adds option to portfolio
+        # must provide the contract name, market price and side ("Buy" or "Sell")
+        self.add_options([id], [price], [side])
+
+    def remove_option(self, id):
+        # removes option from portfolio based on contract name
+        # added for readability and symmetry with add_option method
+        self.remove_options([id])
+
+    def scenario_grid(self, spot_shocks, vol_shocks=(0.,), time_shocks=(0.,), max_bytes=64*2**20):
+        # P&L and delta of the portfolio over spot x vol x time shocks at the implied vols (see Scenarios),
+        # one contract per option, sold options are short
+        n = len(self.contracts)
+        vol = self.greeks[:n, 0]*self.signs[:n] # greeks are signed like the side
+        return scenario_grid(self.s, self.strikes[:n], self.r, self.q, vol, self.ttes[:n], self.calls[:n], self.signs[:n],
+                             spot_shocks, vol_shocks, time_shocks, max_bytes)
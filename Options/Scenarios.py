@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+from BlackScholes import is_call, euro_price
+
+# Scenario (stress) grids of books of European options
+# every position is repriced under every combination of spot, vol and time shocks in one
+#   broadcasted computation of shape (positions, spot shocks, vol shocks, time shocks), the terms
+#   that only depend on spot (log(S/K)) or on vol and time (the total vol, discount factors) are
+#   computed on their own axes and only d1, d2, the two cdfs and the price take the full shape
+# puts are valued as calls through put call parity (P = C - S e^-qT + K e^-rT, the parity terms
+#   are linear in the positions and summed on the small axes), and positions with the same strike,
+#   expiry and vol are merged, so a straddle costs one call
+# positions are taken in chunks so that the full shape arrays of a chunk stay under max_bytes,
+#   each chunk is reduced over its positions (quantity @ values) before the next one
+# shocks: spot as a relative move (-.1 is spot down 10%), vol in vol points as a decimal
+#   (.05 is 5 points, vols are floored at min_vol), time in years elapsed (options past
+#   their expiry are worth their payoff)
+
+scenario_fields = ['pnl', 'delta']
+temporaries = 6 # full shape arrays alive at once while a chunk is valued
+min_vol = 1e-4
+
+def call_values(S, K, r, q, vol, T, spot, dvol, dt):
+    # prices and deltas of a chunk of calls (columns of shape (positions, 1, 1, 1)) under every shock,
+    # shaped (positions, spot shocks, vol shocks, time shocks)
+    shocked = S*(1 + spot[:, None, None]) # (spot, 1, 1)
+    left = np.maximum(T - dt, 0) # (positions, 1, 1, time)
+    w = np.maximum(vol + dvol[:, None], min_vol)*np.sqrt(left) # (positions, 1, vol, time)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_w = 1/w
+        moneyness = np.log(shocked/K) # (positions, spot, 1, 1)
+        drift = (r - q)*left*inv_w + .5*w
+        D1 = moneyness*inv_w
+        D1 += drift
+        D2 = D1 - w
+        cdf1 = ndtr(D1, out=D1)
+        cdf2 = ndtr(D2, out=D2)
+    q_disc = np.exp(-q*left)
+    delta = cdf1*q_disc
+    price = np.multiply(delta, shocked, out=cdf1)
+    cdf2 *= K*np.exp(-r*left)
+    price -= cdf2
+    rows, times = np.nonzero(left[:, 0, 0, :] == 0) # expired (position, time shock) pairs
+    if len(rows):
+        payoff = np.maximum(shocked[:, 0, 0] - K[rows, 0, 0, 0, None], 0)[:, :, None] # (expired, spot, 1)
+        price[rows, :, :, times] = payoff
+        delta[rows, :, :, times] = payoff > 0
+    return price, delta
+
+def scenario_grid(S, K, r, q, vol, T, style, quantity, spot_shocks, vol_shocks=(0.,), time_shocks=(0.,),
+                  max_bytes=64*2**20):
+    '''
+    P&L and delta of a book of European options under every combination of shocks
+    S - spot, K, vol, T (years to expiry), style and quantity (negative for short positions)
+        are arrays with one element per position, r, q - rates as decimals
+    spot_shocks, vol_shocks, time_shocks - see the top of the module
+    max_bytes - memory of the full shape arrays of one chunk of positions
+    Returns a structured array (fields in scenario_fields) shaped (spot shocks, vol shocks,
+        time shocks): pnl is the change of the book's value from its value at vol without
+        shocks, delta the book's delta in shares
+    Positions without a vol (NaN) are left out
+    '''
+    spot = np.asarray(spot_shocks, dtype=float)
+    dvol = np.asarray(vol_shocks, dtype=float)
+    dt = np.asarray(time_shocks, dtype=float)
+    args = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (K, vol, T, quantity)], is_call(style))
+    K, vol, T, quantity, call = [a.ravel() for a in args]
+    keep = np.isfinite(vol) & (quantity != 0)
+    K, vol, T, quantity, call = K[keep], vol[keep], T[keep], quantity[keep], call[keep]
+    base = quantity @ euro_price(S, K, r, q, vol, T, call)
+
+    # parity terms of the puts, on the (spot, time) axes
+    puts = quantity*~call
+    left = np.maximum(T[:, None] - dt, 0)
+    put_q = puts @ np.exp(-q*left) # (time,)
+    put_r = (puts*K) @ np.exp(-r*left)
+    shocked = S*(1 + spot)
+    pnl = (put_r - shocked[:, None]*put_q)[:, None, :] - base # (spot, 1, time)
+    delta = -put_q[None, None, :]
+
+    # every position as a call, merged by strike, expiry and vol
+    contracts, inverse = np.unique(np.stack((K, T, vol), axis=1), axis=0, return_inverse=True)
+    net = np.bincount(inverse.ravel(), weights=quantity, minlength=len(contracts))
+    contracts, net = contracts[net != 0], net[net != 0]
+
+    shape = (len(spot), len(dvol), len(dt))
+    scenarios = len(spot)*len(dvol)*len(dt)
+    chunk = max(1, int(max_bytes//(8*temporaries*scenarios)))
+    calls = np.zeros(scenarios)
+    call_delta = np.zeros(scenarios)
+    for start in range(0, len(net), chunk):
+        rows = slice(start, start + chunk)
+        K_c, T_c, vol_c = [contracts[rows, i, None, None, None] for i in range(3)]
+        price, position_delta = call_values(S, K_c, r, q, vol_c, T_c, spot, dvol, dt)
+        calls += net[rows] @ price.reshape(len(price), -1)
+        call_delta += net[rows] @ position_delta.reshape(len(price), -1)
+
+    out = np.empty(shape, dtype=[(name, float) for name in scenario_fields])
+    out['pnl'] = calls.reshape(shape) + pnl
+    out['delta'] = call_delta.reshape(shape) + delta
+    return out
+
+def ladder(grid, field, spot_shocks, vol_shocks, time=0):
+    '''
+    One time slice (index time of the time shocks) of a field of scenario_grid as a dataframe,
+        one row per spot shock and one column per vol shock
+    '''
+    return pd.DataFrame(grid[field][:, :, time], index=pd.Index(spot_shocks, name='spot shock'),
+                        columns=pd.Index(vol_shocks, name='vol shock'))
@@ -0,0 +1,418 @@
+import os
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from scipy import optimize
+from BlackScholes import euro_price, euro_greeks
+from Greeks import get_greeks
+import BinomialTree
+from BinomialTree import crr_tree
+from AmericanVol import american_implied_vol
+from OptionChainCalculator import OptionChain
+from VolSurface import VolSurface
+from OptionPortfolio import OptionPortfolio
+from Scenarios import scenario_grid, ladder
+from ContractMaster import ContractMaster, parse_symbols
+
+# Benchmarks for the option pricing modules
+# run as: python option_benchmarks.py <name>, with no name every benchmark runs
+# a check against the code a benchmark replaces that fails raises AssertionError
+
+start_date = datetime(2024, 1, 2)
+
+def check(ok, message):
+    # checks stop the run instead of only being printed (unlike assert, not skipped under -O)
+    if not ok:
+        raise AssertionError(message)
+
+def contract_name(ticker, expiry, style, strike):
+    # OCC style contract name, like the ones in Yahoo Finance option chains
+    return '%s%s%s%08d' % (ticker, expiry.strftime('%y%m%d'), style, round(strike*1000))
+
+def synthetic_chain(n_quotes, spot=100., rfr=.04, div=.01, days=90, style='C', seed=0):
+    # single tenor chain priced off a smile, with a bid ask spread around the model price
+    rng = np.random.default_rng(seed)
+    expiry = start_date + timedelta(days=days)
+    T = days/252
+    strikes = np.round(spot*np.exp(np.linspace(-.8, .8, n_quotes)), 3)
+    vols = .25 + .3*np.log(strikes/spot)**2 - .05*np.log(strikes/spot)
+    mid = euro_price(spot, strikes, rfr, div, vols, T, style)
+    spread = np.maximum(.01, .002*mid)*rng.uniform(.5, 1.5, n_quotes)
+    return pd.DataFrame({'Contract Name': [contract_name('AAPL', expiry, style, k) for k in strikes],
+                         'Strike': strikes, 'Bid': mid - spread/2, 'Ask': mid + spread/2}), vols
+
+def bench_iv(n_quotes=10000, tenors=20, repeat=3):
+    # implied vols of a chain with the vectorized solver against the row by row scipy newton it replaced
+    spot, rfr, div = 100., .04, .01
+    data, vols = synthetic_chain(n_quotes, spot, rfr, div)
+    chain = OptionChain(spot, rfr, div, start_date, data.copy())
+    prices = .5*(data.Bid + data.Ask)
+
+    def row_by_row():
+        out = []
+        for K, V in zip(data.Strike, prices):
+            try:
+                out.append(optimize.newton(chain.zero_euro, 2, chain.vega, args=(spot, K, rfr, div, chain.T, V, 'C')))
+            except Exception:
+                out.append(0)
+        return np.array(out)
+
+    t1 = time.time()
+    old = row_by_row()
+    t2 = time.time()
+    best = np.inf
+    for _ in range(repeat):
+        t3 = time.time()
+        chain.iv_adder()
+        best = min(best, time.time() - t3)
+    new = chain.data['imp_vol'].to_numpy()
+    print('iv chain: %d quotes, row by row newton %.3fs (%d failed), vectorized %.4fs (%d NaN), %.0fx, max |new - old| %.2e'
+          % (n_quotes, t2-t1, int(np.sum(~np.isfinite(old) | (old <= 0))), best, int(np.isnan(new).sum()),
+             (t2-t1)/best, np.nanmax(np.abs(new - old))))
+    solved = np.isfinite(old) & (old > 0)
+    check(np.all(np.isfinite(new[solved])), 'iv chain: vectorized solver fails where newton solved')
+    check(np.max(np.abs(new - old)[solved]) <= 1e-8, 'iv chain: vectorized vols differ from newton')
+
+    # whole surface, every tenor solved in one call
+    data = {}
+    for i in range(tenors):
+        days = 14*(i + 1)
+        df, _ = synthetic_chain(n_quotes//tenors, spot, rfr, div, days=days, seed=i)
+        data[(start_date + timedelta(days=days)).strftime('%B %d, %Y')] = df
+    surface = VolSurface(spot, rfr, div, start_date, data)
+    t1 = time.time()
+    surface.implied_vol_surface()
+    t2 = time.time()
+    print('iv surface: %d tenors x %d strikes in %.4fs, %d NaN'
+          % (tenors, n_quotes//tenors, t2-t1, int(surface.iv_surface.isna().sum().sum())))
+
+def bench_greeks(n_quotes=10000, repeat=5):
+    # chain greeks: row by row apply against the fused kernel, through the separate adders and greeks_adder
+    spot, rfr, div = 100., .04, .01
+    data, _ = synthetic_chain(n_quotes, spot, rfr, div)
+    chain = OptionChain(spot, rfr, div, start_date, data)
+    chain.iv_adder()
+    K, vol, T = chain.data.Strike.to_numpy(), chain.data.imp_vol.to_numpy(), chain.T
+
+    # the row by row apply the european adders used before they went through the fused kernel
+    t1 = time.time()
+    old = np.array([chain.data.apply(fn, axis=1).to_numpy() for fn in (
+        lambda x: chain.euro_delta(x.Strike, x.imp_vol),
+        lambda x: chain.euro_gamma(spot, x.Strike, rfr, div, x.imp_vol, T),
+        lambda x: chain.euro_vega(spot, x.Strike, rfr, div, x.imp_vol, T),
+        lambda x: chain.euro_volga(spot, x.Strike, rfr, div, x.imp_vol, T),
+        lambda x: chain.euro_vanna(spot, x.Strike, rfr, div, x.imp_vol, T))]).T
+    t2 = time.time()
+
+    def best_of(fn):
+        best = np.inf
+        for _ in range(repeat):
+            t = time.time()
+            fn()
+            best = min(best, time.time() - t)
+        return best
+
+    fused = best_of(lambda: euro_greeks(spot, K, rfr, div, vol, T, 'C'))
+    separate = best_of(lambda: [adder() for adder in (chain.delta_adder, chain.gamma_adder, chain.vega_adder,
+                                                      chain.volga_adder, chain.vanna_adder)])
+    each = chain.data[['delta', 'gamma', 'vega', 'volga', 'vanna']].to_numpy()
+    adder = best_of(chain.greeks_adder)
+    new = chain.data[['delta', 'gamma', 'vega', 'volga', 'vanna']].to_numpy()
+    print('greeks: %d quotes, row by row apply %.3fs, fused kernel %.4fs (9 outputs), separate adders %.4fs, '
+          'greeks_adder %.4fs, max relative difference %.2e'
+          % (n_quotes, t2-t1, fused, separate, adder, np.max(np.abs(new - old)/(1 + np.abs(old)))))
+    check(np.max(np.abs(new - old)/(1 + np.abs(old))) <= 1e-10, 'greeks: greeks_adder differs from the row by row greeks')
+    check(np.max(np.abs(each - old)/(1 + np.abs(old))) <= 1e-10, 'greeks: separate adders differ from the row by row greeks')
+
+    # Greeks.get_greeks: one contract per call (how OptionPortfolio used it) against one call for the chain
+    V = (.5*(data.Bid + data.Ask)).to_numpy()
+    n = 1000
+    t1 = time.time()
+    one = np.array([get_greeks(V[i], spot, K[i], rfr, div, T, None, 'C') for i in range(n)])
+    t2 = time.time()
+    batch = best_of(lambda: get_greeks(V, spot, K, rfr, div, T, None, 'C'))
+    every = get_greeks(V, spot, K, rfr, div, T, None, 'C')
+    print('greeks: get_greeks one contract per call %.1fus/contract, batched %.2fus/contract, max |difference| %.2e'
+          % ((t2-t1)/n*1e6, batch/n_quotes*1e6, np.nanmax(np.abs(every[:n] - one))))
+    check(np.array_equal(np.isnan(every[:n]), np.isnan(one)) and np.nanmax(np.abs(every[:n] - one)) <= 1e-10,
+          'greeks: batched get_greeks differs from one contract per call')
+
+def reference_crr_tree(S, K, r, div, vol, T, N, op_style):
+    # one contract per call, recomputing the node prices of every step from powers of u and d
+    # (what OptionChain.american_crr_tree did before BinomialTree)
+    dt = T/N
+    u = np.exp(vol*np.sqrt(dt))
+    d = 1/u
+    q = (np.exp((r-div)*dt) - d)/(u-d)
+    disc = np.exp(-r*dt)
+    S_prices = S * d**(np.arange(N,-1,-1)) * u**(np.arange(0,N+1,1))
+    C = np.maximum(0, K - S_prices) if op_style == 'P' else np.maximum(0, S_prices - K)
+    for i in np.arange(N-1,-1,-1):
+        S_prices = S * d**(np.arange(i,-1,-1)) * u**(np.arange(0,i+1,1))
+        C[:i+1] = disc * ( q*C[1:i+2] + (1-q)*C[0:i+1] )
+        C = C[:-1]
+        C = np.maximum(C, K - S_prices) if op_style == 'P' else np.maximum(C, S_prices - K)
+    return C[0]
+
+def bench_tree(n_contracts=500, n_reference=50, N=1000):
+    # american prices: one contract per call against the batched numpy and numba engines
+    rng = np.random.default_rng(0)
+    S, r, q = 100., .04, .02
+    K = rng.uniform(60, 140, n_contracts)
+    T = rng.uniform(.05, 2, n_contracts)
+    vol = rng.uniform(.1, .8, n_contracts)
+    style = np.where(rng.random(n_contracts) < .5, 'C', 'P')
+
+    t1 = time.time()
+    ref = np.array([reference_crr_tree(S, K[i], r, q, vol[i], T[i], N, style[i]) for i in range(n_reference)])
+    old = (time.time() - t1)/n_reference
+    print('tree: one contract per call %.2fms/contract' % (old*1e3))
+
+    engines = [('numpy', False)] + ([('numba', True)] if BinomialTree.numba is not None else [])
+    for name, numba in engines:
+        BinomialTree.use_numba = numba
+        crr_tree(S, K[:2], r, q, vol[:2], T[:2], style[:2], N) # compiles the numba kernel
+        t1 = time.time()
+        prices = crr_tree(S, K, r, q, vol, T, style, N)
+        new = (time.time() - t1)/n_contracts
+        print('tree: batched %-5s %.3fms/contract, %.0fx, max |difference| %.2e'
+              % (name, new*1e3, old/new, np.abs(prices[:n_reference] - ref).max()))
+        check(np.abs(prices[:n_reference] - ref).max() <= 1e-9, 'tree: batched %s prices differ from the reference tree' % name)
+    BinomialTree.use_numba = BinomialTree.numba is not None
+
+    # american greeks: bumped finite differences (14 trees per strike, what OptionChain did before)
+    # against the extended tree engine (3 trees per strike), through greeks_adder and the separate adders
+    n_strikes = 200
+    data, _ = synthetic_chain(n_strikes, style='P')
+    data['imp_vol'] = .3
+    chain = OptionChain(S, r, q, start_date, data.copy(), type='A')
+    K, vol = chain.data.Strike.to_numpy(), chain.data.imp_vol.to_numpy()
+    # spot and vol bumps of delta, gamma, vega, volga and vanna, relative to spot and vol
+    bumps = np.array([(1, 0), (-1, 0), (1, 0), (-1, 0), (0, 0), (0, 1), (0, -1), (0, 1), (0, -1), (0, 0),
+                      (1, 1), (1, -1), (-1, 1), (-1, -1)])*.001
+    t1 = time.time()
+    crr_tree(S*(1 + bumps[:, :1]), K, r, q, vol*(1 + bumps[:, 1:]), chain.T, 'P', N)
+    t2 = time.time()
+    print('tree: american greeks, %d strikes, bumped finite differences %.3fs (14 trees per strike)' % (n_strikes, t2-t1))
+
+    t1 = time.time()
+    chain.greeks_adder()
+    t2 = time.time()
+    print('tree: american greeks_adder %.3fs (%.1f trees per strike)' % (t2-t1, chain.tree_cache.misses/n_strikes))
+
+    chain = OptionChain(S, r, q, start_date, data.copy(), type='A')
+    t1 = time.time()
+    chain.delta_adder()
+    chain.gamma_adder()
+    chain.vega_adder()
+    chain.volga_adder()
+    chain.vanna_adder()
+    t2 = time.time()
+    print('tree: american separate adders %.3fs (%.1f trees per strike, %d cache hits)'
+          % (t2-t1, chain.tree_cache.misses/n_strikes, chain.tree_cache.hits))
+
+def counted_trees(fn, N=1000):
+    # runs fn while counting the tree work, in N step tree valuations (a tree costs N**2/2 node updates)
+    run_tree = BinomialTree.run_tree
+    work = [0.]
+    def counting(S, K, u, p, disc, call, steps, stop=0):
+        work[0] += len(S)*steps*steps/(N*N)
+        return run_tree(S, K, u, p, disc, call, steps, stop)
+    BinomialTree.run_tree = counting
+    try:
+        t1 = time.time()
+        out = fn()
+        return out, time.time() - t1, work[0]
+    finally:
+        BinomialTree.run_tree = run_tree
+
+def bench_american_iv(n_quotes=100, N=1000):
+    # american implied vols: scipy newton (secant) from vol 2 on the N step tree per quote, what
+    # OptionChain did before, against the staged solver of AmericanVol
+    spot, rfr, div = 100., .04, .03
+    data, _ = synthetic_chain(n_quotes, spot, rfr, div, days=180, style='P')
+    chain = OptionChain(spot, rfr, div, start_date, data, type='A')
+    K = data.Strike.to_numpy()
+    vols = .25 + .3*np.log(K/spot)**2 - .05*np.log(K/spot)
+    prices = crr_tree(spot, K, rfr, div, vols, chain.T, 'P', N)
+
+    def secant():
+        out = []
+        for k, V in zip(K, prices):
+            try:
+                out.append(optimize.newton(chain.zero_amer, 2, args=(spot, k, rfr, div, chain.T, V, 'P')))
+            except Exception:
+                out.append(np.nan)
+        return np.array(out)
+
+    old, old_time, old_work = counted_trees(secant, N)
+    new, new_time, new_work = counted_trees(lambda: american_implied_vol(prices, spot, K, rfr, div, chain.T, 'P', N), N)
+    # deep in the money puts priced at their exercise value have no single vol, only the others are compared
+    solvable = prices - np.maximum(K - spot, 0) > 1e-8
+    print('american iv: %d quotes (%d above exercise value), secant %.3fs %.1f trees per quote (%d failed), '
+          'staged %.3fs %.2f trees per quote (%d NaN), on quotes above exercise value max |staged - secant| %.2e, '
+          'max |staged - true vol| %.2e'
+          % (n_quotes, solvable.sum(), old_time, old_work/n_quotes, int(np.sum(~np.isfinite(old[solvable]))), new_time,
+             new_work/n_quotes, int(np.isnan(new[solvable]).sum()), np.nanmax(np.abs(new - old)[solvable]),
+             np.nanmax(np.abs(new - vols)[solvable])))
+    # the secant often fails or lands on another vol, the staged solver is checked against the true vols
+    check(not np.isnan(new[solvable]).any(), 'american iv: staged solver fails on quotes above exercise value')
+    check(np.max(np.abs(new - vols)[solvable]) <= 1e-6, 'american iv: staged vols differ from the true vols')
+
+def bench_surface(tenors=12, strikes=50, workers=(1, 2, 4)):
+    # american implied vol surface solved by process pools of different sizes, speedup against one process
+    # (the first pool also starts the fork server, see VolSurface)
+    spot, rfr, div = 100., .04, .03
+    data = {}
+    for i in range(tenors):
+        days = 30*(i + 1)
+        df, _ = synthetic_chain(strikes, spot, rfr, div, days=days, style='P', seed=i)
+        data[(start_date + timedelta(days=days)).strftime('%B %d, %Y')] = df
+    base, first = None, None
+    for n in workers:
+        surface = VolSurface(spot, rfr, div, start_date, {k: v.copy() for k, v in data.items()}, type='A', style='P')
+        t1 = time.time()
+        surface.implied_vol_surface(workers=n)
+        t2 = time.time()
+        base = base or t2 - t1
+        ivs = surface.iv_surface.to_numpy()
+        first = ivs if first is None else first
+        print('surface: american, %d tenors x %d strikes, %d cores, %d workers %.3fs, speedup %.2fx, %d NaN, '
+              'max |difference| %.1e' % (tenors, strikes, os.cpu_count(), n, t2-t1, base/(t2-t1), int(np.isnan(ivs).sum()), np.nanmax(np.abs(ivs - first))))
+        check(np.array_equal(np.isnan(ivs), np.isnan(first)) and np.nanmax(np.abs(ivs - first)) <= 1e-12,
+              'surface: %d workers solve different vols than one' % n)
+
+def bench_portfolio(n_legs=1000):
+    # building a book one leg at a time: every leg valuing the whole book (what add_option did before)
+    # against valuing only the new leg, then bulk adds, a spot revaluation and removing half the legs
+    spot, rfr, div = 100., .04, .01
+    calls, _ = synthetic_chain(n_legs, spot, rfr, div, style='C')
+    puts, _ = synthetic_chain(n_legs, spot, rfr, div, style='P')
+    data = pd.concat([calls, puts], ignore_index=True)
+    today = start_date.strftime('%Y/%m/%d')
+    # only quotes with a vol on the portfolio's time to maturity (days/365), at spot and after the revaluation
+    probe = OptionPortfolio('AAPL', spot, rfr, div, today)
+    probe.add_options(data['Contract Name'], .5*(data.Bid + data.Ask), ['Buy']*len(data))
+    solvable = np.isfinite(probe.option_greeks['Implied Vol'].to_numpy())
+    probe.revalue(spot=spot + 1)
+    solvable &= np.isfinite(probe.option_greeks['Implied Vol'].to_numpy())
+    data = data[solvable].iloc[:n_legs]
+    ids = data['Contract Name'].tolist()
+    prices = (.5*(data.Bid + data.Ask)).tolist()
+    sides = ['Buy' if i % 3 else 'Sell' for i in range(len(ids))]
+
+    old = OptionPortfolio('AAPL', spot, rfr, div, today)
+    t1 = time.time()
+    for i in range(len(ids)):
+        old.add_option(ids[i], prices[i], sides[i])
+        old.update_portfolio_greeks()
+    t2 = time.time()
+    book = OptionPortfolio('AAPL', spot, rfr, div, today)
+    for i in range(len(ids)):
+        book.add_option(ids[i], prices[i], sides[i])
+    t3 = time.time()
+    print('portfolio: %d legs one at a time, whole book valued %.3fs (%d contract valuations), '
+          'new leg only %.3fs (%d contract valuations), max |difference| %.2e'
+          % (len(ids), t2-t1, old.evaluations, t3-t2, book.evaluations,
+             np.max(np.abs(old.portfolio_greeks - book.portfolio_greeks))))
+    check(np.max(np.abs(old.portfolio_greeks - book.portfolio_greeks)) <= 1e-8, 'portfolio: new leg only greeks differ from the whole book')
+
+    bulk = OptionPortfolio('AAPL', spot, rfr, div, today)
+    t1 = time.time()
+    bulk.add_options(ids, prices, sides)
+    t2 = time.time()
+    bulk.revalue(spot=spot + 1)
+    t3 = time.time()
+    bulk.remove_options(ids[::2])
+    t4 = time.time()
+    scratch = OptionPortfolio('AAPL', spot + 1, rfr, div, today)
+    scratch.add_options(ids[1::2], prices[1::2], sides[1::2])
+    print('portfolio: add_options %.4fs, revalue %.4fs, remove_options of half %.4fs, '
+          'max |incremental - from scratch| portfolio greeks %.2e'
+          % (t2-t1, t3-t2, t4-t3, np.max(np.abs(bulk.portfolio_greeks - scratch.portfolio_greeks))))
+    check(np.max(np.abs(bulk.portfolio_greeks - scratch.portfolio_greeks)) <= 1e-8, 'portfolio: incremental greeks differ from scratch')
+
+def bench_scenarios(n_straddles=5000, max_bytes=64*2**20):
+    # straddle book over 21 spot x 11 vol x 5 time shocks: one scenario at a time (repricing the book
+    # per scenario) against the broadcasted grid, and the grid with a small memory bound
+    rng = np.random.default_rng(0)
+    spot, rfr, div = 100., .04, .01
+    K = np.repeat(np.round(spot*rng.uniform(.8, 1.2, n_straddles)), 2)
+    T = np.repeat(rng.integers(1, 180, n_straddles)/365, 2)
+    vol = np.repeat(rng.uniform(.15, .6, n_straddles), 2)
+    style = np.tile(['C', 'P'], n_straddles)
+    quantity = np.repeat(np.where(rng.random(n_straddles) < .7, 1., -1.)*rng.integers(1, 10, n_straddles), 2)
+    spot_shocks = np.linspace(-.1, .1, 21)
+    vol_shocks = np.linspace(-.05, .05, 11)
+    time_shocks = np.array([0, 1, 5, 10, 30])/365
+
+    t1 = time.time()
+    base = quantity @ euro_price(spot, K, rfr, div, vol, T, style)
+    old = np.empty((len(spot_shocks), len(vol_shocks), len(time_shocks)))
+    with np.errstate(divide='ignore'):
+        for i, ds in enumerate(spot_shocks):
+            for j, dv in enumerate(vol_shocks):
+                for k, dt in enumerate(time_shocks):
+                    left = np.maximum(T - dt, 1e-20) # expired options at (almost) their payoff
+                    old[i, j, k] = quantity @ euro_price(spot*(1 + ds), K, rfr, div, vol + dv, left, style) - base
+    t2 = time.time()
+    grid = scenario_grid(spot, K, rfr, div, vol, T, style, quantity, spot_shocks, vol_shocks, time_shocks, max_bytes)
+    t3 = time.time()
+    small = scenario_grid(spot, K, rfr, div, vol, T, style, quantity, spot_shocks, vol_shocks, time_shocks, 2**20)
+    t4 = time.time()
+    ladder(grid, 'pnl', spot_shocks, vol_shocks)
+    print('scenarios: %d positions x %d scenarios, one scenario at a time %.3fs, grid %.3fs (%.0fx), grid in 1MB chunks '
+          '%.3fs, max |grid - per scenario| %.2e, max |chunked - grid| %.2e'
+          % (len(K), old.size, t2-t1, t3-t2, (t2-t1)/(t3-t2), t4-t3, np.abs(grid['pnl'] - old).max(),
+             np.abs(small['pnl'] - grid['pnl']).max()))
+    # the per scenario reference values expired options a hair before expiry, hence the looser bound
+    check(np.abs(grid['pnl'] - old).max() <= 1e-5, 'scenarios: grid differs from repricing per scenario')
+    check(np.abs(small['pnl'] - grid['pnl']).max() <= 1e-6, 'scenarios: chunked grid differs from the grid')
+
+def bench_contracts(n_expiries=50, n_strikes=1000, n_pairing=2000):
+    # parsing a chain's OCC symbols: regex and strptime per symbol (op_contract_dec before ContractMaster)
+    # against parse_symbols, and pairing calls with puts by slicing symbols and searching the list of
+    # contracts (AlgoStraddleTrading before ContractMaster) against the pair index
+    symbols = [contract_name('NVDA', start_date + timedelta(days=7*e), style, 50 + .5*k)
+               for e in range(n_expiries) for k in range(n_strikes) for style in 'CP']
+    regex = r"^([A-z]{1,5})(\d{6})([CPcp])([\d.]+)"
+
+    t1 = time.time()
+    old = []
+    for symbol in symbols:
+        matches = re.findall(regex, symbol)
+        old.append((datetime.strptime(matches[0][1], '%y%m%d'), matches[0][2], float(matches[0][3])/1000))
+    t2 = time.time()
+    parsed = parse_symbols(symbols)
+    t3 = time.time()
+    same = all(d.date() == e.astype(datetime) and t == u and k == l/1000 for (d, t, k), (e, u, l)
+               in zip(old, zip(parsed['expiry'], parsed['type'], parsed['strike'])))
+    print('contracts: %d symbols, regex per symbol %.3fs, parse_symbols %.4fs (%.0fx), same contracts %s'
+          % (len(symbols), t2-t1, t3-t2, (t2-t1)/(t3-t2), same))
+    check(same, 'contracts: parse_symbols differs from the regex')
+
+    subset = symbols[:n_pairing]
+    t1 = time.time()
+    old = [call[:10] + 'P' + call[11:] for call in subset if call[10] == 'C']
+    old = [put for put in old if put in subset]
+    t2 = time.time()
+    master = ContractMaster()
+    ids = master.intern(subset)
+    calls = ids[master.contracts(ids)['type'] == 'C']
+    new = [master.symbols[put] for put in master.pair(calls) if put >= 0]
+    t3 = time.time()
+    print('contracts: pairing %d contracts, slicing and list search %.4fs, contract master %.4fs, same pairs %s'
+          % (n_pairing, t2-t1, t3-t2, old == new))
+    check(old == new, 'contracts: contract master pairs differ from the list search')
+
+benchmarks = {'iv': bench_iv, 'greeks': bench_greeks, 'tree': bench_tree, 'american_iv': bench_american_iv,
+              'surface': bench_surface, 'portfolio': bench_portfolio, 'scenarios': bench_scenarios,
+              'contracts': bench_contracts}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        benchmarks[name]()